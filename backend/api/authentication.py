@@ -0,0 +1,111 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+User = get_user_model()
+
+
+class LRUCache:
+    """Ограниченный по размеру кеш процесса с временем жизни записей."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.items.pop(key, None)
+
+
+token_users = LRUCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT)
+# Поля пользователя, нужные запросам: данные профиля и права. Пароль
+# и прочие поля не кешируются, экземпляр догружает их из БД при обращении.
+# Порядок - как в модели: этого требует Model.from_db().
+USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {
+        'id', 'email', 'username', 'first_name', 'last_name', 'is_active',
+        'is_staff', 'is_superuser',
+    }
+]
+
+
+def cache_key(key):
+    return f'token:{key}'
+
+
+def get_token_user(key):
+    """Значения полей пользователя токена из кеша или None.
+
+    С общим кешем читается только он: запись, удалённая одним процессом,
+    не должна оставаться в кеше процесса у других.
+    """
+    if settings.TOKEN_CACHE_SHARED:
+        return cache.get(cache_key(key))
+    return token_users.get(key)
+
+
+def set_token_user(key, user):
+    values = tuple(getattr(user, field) for field in USER_FIELDS)
+    if settings.TOKEN_CACHE_SHARED:
+        cache.set(cache_key(key), values, settings.TOKEN_CACHE_TIMEOUT)
+    else:
+        token_users.set(key, values)
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кеша процесса и общего кеша.
+
+    Без общего кеша другие процессы увидят изменения не позже чем
+    через TOKEN_CACHE_TIMEOUT секунд, с общим кешем - сразу.
+    """
+    keys = list(keys)
+    token_users.delete(keys)
+    if settings.TOKEN_CACHE_SHARED:
+        cache.delete_many([cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для недавно виденных токенов.
+
+    Кешируются только действующие токены активных пользователей и только
+    поля USER_FIELDS. Каждый запрос получает свой экземпляр пользователя.
+    """
+
+    def authenticate_credentials(self, key):
+        values = get_token_user(key)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            set_token_user(key, user)
+            return user, token
+        user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, values)
+        return user, self.get_model()(key=key, user=user)
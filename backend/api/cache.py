@@ -0,0 +1,206 @@
+import time
+
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from hashlib import md5
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import FavouriteRecipe, ShoppingCart
+from users.models import Follow
+
+# Кеш процесса (LocMemCache) у каждого воркера свой: версии, увеличенные
+# в одном процессе, другие не видят, поэтому записи в нём живут недолго.
+SHARED_CACHE = not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+# Готовые справочники перечитываются из БД не реже, чем раз в это время.
+CATALOG_TIMEOUT = 60 * 5
+# Общие части рецептов содержат названия тэгов и ингредиентов.
+RECIPE_TIMEOUT = 60 * 60 * 24 if SHARED_CACHE else CATALOG_TIMEOUT
+# Изменения связей в обход сигналов (bulk_create, update(), SQL), а без
+# общего кеша и сделанные в других процессах, попадают в кеш не позже
+# чем через это время.
+RELATIONS_TIMEOUT = 60 * 60 if SHARED_CACHE else CATALOG_TIMEOUT
+# Связи пользователя: имя -> (модель, поле с id цели).
+USER_RELATIONS = {
+    'favourites': (FavouriteRecipe, 'recipe_id'),
+    'cart': (ShoppingCart, 'recipe_id'),
+    'follows': (Follow, 'author_id'),
+}
+# Попадания и промахи кеша рецептов в текущем процессе.
+recipe_cache_stats = Counter(hits=0, misses=0)
+
+
+def catalog_version(name):
+    """Текущая версия справочника name."""
+    key = f'catalog:{name}:version'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_catalog_version(name):
+    """Инвалидирует закешированный справочник name."""
+    try:
+        cache.incr(f'catalog:{name}:version')
+    except ValueError:
+        catalog_version(name)
+
+
+def get_catalog(name, render):
+    """Готовый JSON справочника и его ETag.
+
+    Содержимое хранится под ключом с версией справочника, поэтому
+    после изменения справочника старые записи просто перестают читаться.
+    """
+    key = f'catalog:{name}:{catalog_version(name)}'
+    entry = cache.get(key)
+    if entry is None:
+        content = render()
+        entry = (content, quote_etag(md5(content).hexdigest()))
+        cache.set(key, entry, timeout=CATALOG_TIMEOUT)
+    return entry
+
+
+def recipe_key(version, recipe):
+    """Ключ общей части рецепта.
+
+    Включает время изменения рецепта, поэтому правка рецепта сама меняет
+    ключ во всех процессах, без удаления записей из кеша. Версия 'recipes'
+    увеличивается при изменении тэгов и ингредиентов, что сбрасывает кеш
+    всех рецептов сразу.
+    """
+    return f'recipe:{version}:{recipe.pk}:{recipe.updated.timestamp()}'
+
+
+def get_recipe_fragments(recipes, render):
+    """Общие для всех пользователей представления рецептов {pk: dict}.
+
+    Представления читаются из кеша одним запросом, отсутствующие
+    строятся вызовом render(список рецептов) и сохраняются.
+    """
+    version = catalog_version('recipes')
+    keys = {recipe.pk: recipe_key(version, recipe) for recipe in recipes}
+    cached = cache.get_many(keys.values())
+    fragments = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+    recipe_cache_stats['hits'] += len(fragments)
+    recipe_cache_stats['misses'] += len(missing)
+    if missing:
+        rendered = dict(zip(
+            (recipe.pk for recipe in missing), render(missing)
+        ))
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in rendered.items()},
+            timeout=RECIPE_TIMEOUT,
+        )
+        fragments.update(rendered)
+    return fragments
+
+
+def relations_version_key(user_id):
+    return f'relations:{user_id}:version'
+
+
+class UserRelations:
+    """id избранных рецептов, рецептов в корзине и авторов в подписках.
+
+    Хранятся в кеше отсортированными массивами array('l'), принадлежность
+    проверяется бинарным поиском. Ключи массивов содержат версию связей
+    пользователя: после изменения связей версия увеличивается, и массивы
+    перечитываются из БД. При первой проверке все массивы читаются из кеша
+    одним запросом, отсутствующие - из БД.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.relations = None
+
+    def version(self):
+        key = relations_version_key(self.user.pk)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=RELATIONS_TIMEOUT)
+            version = cache.get(key)
+        return version
+
+    def load(self):
+        version = self.version()
+        keys = {
+            name: f'relations:{self.user.pk}:{version}:{name}'
+            for name in USER_RELATIONS
+        }
+        cached = cache.get_many(keys.values())
+        relations = {}
+        for name, key in keys.items():
+            ids = cached.get(key)
+            if ids is None:
+                model, field = USER_RELATIONS[name]
+                ids = array('l', model.objects.filter(
+                    user=self.user,
+                ).order_by(field).values_list(field, flat=True))
+                # add, а не set: массив, прочитанный до чужой фиксации,
+                # не затирает более свежий.
+                cache.add(key, ids, timeout=RELATIONS_TIMEOUT)
+            relations[name] = ids
+        self.relations = relations
+
+    def contains(self, name, pk):
+        if self.user.is_anonymous:
+            return False
+        if self.relations is None:
+            self.load()
+        ids = self.relations[name]
+        position = bisect_left(ids, pk)
+        return position < len(ids) and ids[position] == pk
+
+
+def user_relations(request):
+    """Связи пользователя запроса, загружаются один раз за запрос."""
+    relations = getattr(request, 'user_relations', None)
+    if relations is None:
+        relations = request.user_relations = UserRelations(request.user)
+    return relations
+
+
+def invalidate_user_relations(user_id):
+    """Сбрасывает закешированные связи пользователя.
+
+    Вызывается после фиксации транзакции: массивы, прочитанные до неё,
+    остаются под старой версией и больше не читаются. Без версии в кеше
+    сбрасывать нечего - следующая проверка создаст новую.
+    """
+    try:
+        cache.incr(relations_version_key(user_id))
+    except ValueError:
+        pass
+
+
+class CachedCatalogMixin:
+    """Отдаёт полный список справочника из кеша.
+
+    Запросы с параметрами (поиск, фильтрация) обрабатываются как обычно.
+    """
+
+    catalog_name = None
+
+    def render_catalog(self):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return JSONRenderer().render(serializer.data)
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        content, etag = get_catalog(self.catalog_name, self.render_catalog)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
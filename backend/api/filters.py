@@ -1,36 +1,124 @@
-from django_filters import AllValuesMultipleFilter, ModelMultipleChoiceFilter
-from django_filters.rest_framework import BooleanFilter, FilterSet
-from rest_framework.filters import SearchFilter
+from django import forms
+from django.db.models import Exists, OuterRef
+from django_filters.rest_framework import (
+    BooleanFilter, CharFilter, ChoiceFilter, Filter, FilterSet,
+)
+from django_filters.widgets import QueryArrayWidget
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe, Tag
+from recipes.models import FavouriteRecipe, Recipe, ShoppingCart
+from recipes.scores import ORDERINGS
+from recipes.search import match_recipes, search_ingredients, search_recipes
 
 
-class IngredientSearchFilter(SearchFilter):
-    """Поиск ингредиента."""
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиента по началу и вхождению названия.
+
+    Параметр limit ограничивает количество результатов.
+    """
     search_param = 'name'
+    limit_param = 'limit'
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_param])
+        except (KeyError, ValueError):
+            return None
+        return limit if limit > 0 else None
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term or view.action != 'list':
+            return queryset
+        return search_ingredients(queryset, term, self.get_limit(request))
+
+
+class SlugListField(forms.Field):
+    """Список значений из повторяющегося параметра: ?tags=a&tags=b."""
+
+    widget = QueryArrayWidget
+
+
+class IntegerListField(SlugListField):
+    """Список целых чисел: ?author=1&author=2 или ?have=1,2."""
+
+    def to_python(self, value):
+        try:
+            return [
+                int(part) for item in value or []
+                for part in item.split(',') if part.strip()
+            ]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Ожидается список чисел.')
+
+
+class SlugListFilter(Filter):
+    field_class = SlugListField
+
+
+class IntegerListFilter(Filter):
+    field_class = IntegerListField
 
 
 class RecipeFilter(FilterSet):
-    """Фильтрация рецептов."""
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(), field_name='tags__slug',
-        to_field_name='slug', label='Тэг')
-    author = AllValuesMultipleFilter(
-        field_name='author__id', label='Автор')
+    """Фильтрация рецептов.
+
+    Каждое условие - отдельный подзапрос EXISTS или IN, поэтому выборка
+    не размножает строки рецептов и не требует DISTINCT, а слаги тэгов
+    не проверяются отдельным запросом.
+    """
+    tags = SlugListFilter(method='filter_tags', label='Тэг')
+    author = IntegerListFilter(method='filter_author', label='Автор')
     is_in_shopping_cart = BooleanFilter(
-        field_name='is_in_shopping_cart', method='filter',
-        label='В списке покупок',)
+        method='filter_user_relation', label='В списке покупок',)
     is_favorited = BooleanFilter(
-        field_name='is_favorited', method='filter', label='В избранном',)
+        method='filter_user_relation', label='В избранном',)
+    search = CharFilter(method='filter_search', label='Поиск')
+    have = IntegerListFilter(method='filter_have', label='Есть ингредиенты')
+    ordering = ChoiceFilter(
+        choices=[(name, name) for name in ORDERINGS],
+        method='filter_ordering', label='Сортировка',
+    )
+
+    relations = {
+        'is_in_shopping_cart': ShoppingCart,
+        'is_favorited': FavouriteRecipe,
+    }
+
+    def filter_tags(self, queryset, name, value):
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value,
+        )))
+
+    def filter_author(self, queryset, name, value):
+        return queryset.filter(author__in=value)
+
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
+    def filter_have(self, queryset, name, value):
+        if not value:
+            return queryset
+        return match_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
 
-    def filter(self, queryset, name, value):
-        if name == 'is_in_shopping_cart' and value:
-            queryset = queryset.filter(shopcart__user=self.request.user)
-        if name == 'is_favorited' and value:
-            queryset = queryset.filter(
-                favourite_recipe__user=self.request.user)
-        return queryset
+    def filter_user_relation(self, queryset, name, value):
+        if not value:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(self.relations[name].objects.filter(
+            user=user, recipe=OuterRef('pk'),
+        )))
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_in_shopping_cart', 'is_favorited']
+        fields = [
+            'author', 'tags', 'is_in_shopping_cart', 'is_favorited', 'search',
+            'have', 'ordering',
+        ]
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.serializers import ListSerializer
+
+from api.cache import recipe_cache_stats
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (1000, 4000, 16000, 64000, 256000, 1000000, 4000000)
+# Одинаковые по форме запросы в одном ответе: признак N+1.
+DUPLICATE_THRESHOLD = 3
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    """Форма запроса: параметры уже вынесены, списки IN схлопываются."""
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками."""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, labels, value):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        for number, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[number] += 1
+                break
+        else:
+            counts[len(self.buckets)] += 1
+        counts[-1] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, counts in self.values.items():
+            prefix = format_labels(labels)
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                yield f'{self.name}_bucket{{{prefix},le="{bound}"}} {total}'
+            yield f'{self.name}_sum{{{prefix}}} {counts[-1]}'
+            yield f'{self.name}_count{{{prefix}}} {total}'
+
+
+class Total:
+    """Счётчик Prometheus с метками."""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = Counter()
+
+    def inc(self, labels, value=1):
+        self.values[labels] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in self.values.items():
+            yield f'{self.name}{{{format_labels(labels)}}} {value}'
+
+
+LABELS = ('view', 'action')
+
+REQUESTS = Total(
+    'foodgram_requests_total', 'Ответы по представлению и статусу.',
+)
+DURATION = Histogram(
+    'foodgram_request_duration_seconds', 'Время ответа.', DURATION_BUCKETS,
+)
+SQL_DURATION = Histogram(
+    'foodgram_request_sql_seconds', 'Время SQL-запросов за ответ.',
+    DURATION_BUCKETS,
+)
+SERIALIZER_DURATION = Histogram(
+    'foodgram_request_serializer_seconds',
+    'Время построения данных ответа сериализаторами (.data).',
+    DURATION_BUCKETS,
+)
+RENDERER_DURATION = Histogram(
+    'foodgram_request_renderer_seconds',
+    'Время рендеринга готовых данных в JSON и другие форматы.',
+    DURATION_BUCKETS,
+)
+QUERIES = Histogram(
+    'foodgram_request_queries', 'SQL-запросов за ответ.', QUERY_BUCKETS,
+)
+DUPLICATES = Total(
+    'foodgram_duplicate_queries_total',
+    'Повторы запросов одной формы в ответе (N+1).',
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_response_size_bytes', 'Размер ответа.', SIZE_BUCKETS,
+)
+METRICS = (
+    REQUESTS, DURATION, SQL_DURATION, SERIALIZER_DURATION, RENDERER_DURATION,
+    QUERIES, DUPLICATES, RESPONSE_SIZE,
+)
+lock = threading.Lock()
+
+
+def format_labels(labels):
+    return ','.join(
+        f'{name}="{value}"'
+        for name, value in zip(LABELS + ('status',), labels)
+    )
+
+
+def expose():
+    """Метрики этого процесса в текстовом формате Prometheus."""
+    with lock:
+        lines = [line for metric in METRICS for line in metric.expose()]
+    lines.append('# HELP foodgram_recipe_cache_total Кеш рецептов.')
+    lines.append('# TYPE foodgram_recipe_cache_total counter')
+    for result, count in recipe_cache_stats.items():
+        lines.append(f'foodgram_recipe_cache_total{{result="{result}"}} '
+                     f'{count}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_labels(request):
+    """Представление и действие без параметров URL."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched', ''
+    view = getattr(match.func, 'cls', None)
+    if view is None:
+        return match.view_name, ''
+    actions = getattr(match.func, 'actions', None) or {}
+    return view.__name__, actions.get(request.method.lower(), '')
+
+
+class QueryRecorder:
+    """Обёртка execute: число, время и формы запросов ответа."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.serialization = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def shapes(self):
+        """Формы запросов ответа от самых частых."""
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[fingerprint(sql)] += count
+        return shapes.most_common()
+
+
+# Запросы текущего ответа. Контекст копируется в потоки sync_to_async,
+# поэтому запросы синхронных представлений под ASGI тоже учитываются.
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # В начало списка: execute_wrapper() снимает обёртки с конца.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class TimedSerializerMixin:
+    """Примесь сериализатора: время построения .data идёт в метрики ответа.
+
+    Учитывается только внешний вызов .data: вложенные сериализаторы
+    выполняются внутри него.
+    """
+
+    @property
+    def data(self):
+        recorder = current_recorder.get()
+        if recorder is None or recorder.serializing:
+            return super().data
+        recorder.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            recorder.serialization += time.perf_counter() - started
+            recorder.serializing = False
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    """ListSerializer с учётом времени построения .data."""
+
+
+class MetricsMiddleware:
+    """Метрики ответов по представлениям и журнал медленных запросов.
+
+    Работает и под WSGI, и под ASGI. Метрики копятся в памяти процесса:
+    каждый процесс gunicorn отдаёт в /api/metrics/ свои значения.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_request = settings.SLOW_REQUEST_MS / 1000
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        started, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        self.finish(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        self.finish(request, response, started)
+        return response
+
+    def start(self, request):
+        request.metrics_recorder = QueryRecorder()
+        request.metrics_render = []
+        token = current_recorder.set(request.metrics_recorder)
+        return time.perf_counter(), token
+
+    def finish(self, request, response, started):
+        duration = time.perf_counter() - started
+        recorder = request.metrics_recorder
+        render = request.metrics_render
+        labels = view_labels(request)
+        shapes = recorder.shapes()
+        duplicates = sum(
+            count - 1 for _, count in shapes if count >= DUPLICATE_THRESHOLD
+        )
+        size = 0 if response.streaming else len(response.content)
+        with lock:
+            REQUESTS.inc(labels + (response.status_code,))
+            DURATION.observe(labels, duration)
+            SQL_DURATION.observe(labels, recorder.duration)
+            QUERIES.observe(labels, recorder.count)
+            SERIALIZER_DURATION.observe(labels, recorder.serialization)
+            RENDERER_DURATION.observe(labels, sum(render))
+            if not response.streaming:
+                RESPONSE_SIZE.observe(labels, size)
+            if duplicates:
+                DUPLICATES.inc(labels, duplicates)
+        if duration >= self.slow_request:
+            logger.warning(
+                'Медленный запрос %s %s (%s %s): %.0f мс, SQL %d за %.0f мс, '
+                'сериализация %.0f мс, рендеринг %.0f мс, %d байт%s',
+                request.method, request.path, *labels, duration * 1000,
+                recorder.count, recorder.duration * 1000,
+                recorder.serialization * 1000, sum(render) * 1000, size,
+                ''.join(
+                    f'\n  {count} x {shape}' for shape, count in shapes[:10]
+                ),
+            )
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после представления: засекаем рендеринг.
+        started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: request.metrics_render.append(
+                time.perf_counter() - started
+            )
+        )
+        return response
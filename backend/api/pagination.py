@@ -0,0 +1,108 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PageLimitPagination(PageNumberPagination):
+    """Постраничная пагинация с размером страницы из параметра limit."""
+
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class KeysetPagination(PageLimitPagination):
+    """Пагинация по ключу (курсору) с откатом на постраничную.
+
+    Включается параметром cursor (для первой страницы - пустым).
+    Следующая страница выбирается условием по keyset_ordering вместо
+    OFFSET, без COUNT(*), и не сдвигается при появлении новых записей.
+    Поля keyset_ordering должны быть упорядочены по убыванию
+    и однозначно определять запись. Если выборка уже явно упорядочена
+    иначе (например, по релевантности поиска), используется постраничная
+    пагинация.
+    """
+
+    cursor_query_param = 'cursor'
+    keyset_ordering = ('-id', )
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        ordering = tuple(queryset.query.order_by)
+        if (self.cursor_query_param not in request.query_params
+                or ordering and ordering != self.keyset_ordering):
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.keyset = [field.lstrip('-') for field in self.keyset_ordering]
+        page_size = self.get_page_size(request)
+        cursor = request.query_params[self.cursor_query_param]
+        queryset = queryset.order_by(*self.keyset_ordering)
+        if cursor:
+            queryset = queryset.filter(self.get_position_filter(
+                queryset.model, self.decode_cursor(cursor)
+            ))
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], field) for field in self.keyset
+            ]
+        return page
+
+    def get_position_filter(self, model, position):
+        """Условие "строго после position" для убывающего порядка."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.keyset, position):
+            try:
+                value = model._meta.get_field(field).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            condition |= Q(**equal, **{f'{field}__lt': value})
+            equal[field] = value
+        return condition
+
+    def encode_cursor(self, position):
+        raw = '|'.join(str(value) for value in position)
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            position = raw.decode().split('|')
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.keyset):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        if self.keyset is None:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class RecipePagination(KeysetPagination):
+    """Пагинация ленты рецептов."""
+
+    keyset_ordering = ('-pub_date', '-id')
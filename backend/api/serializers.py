@@ -1,43 +1,73 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from api.cache import get_recipe_fragments, user_relations
+from api.metrics import TimedListSerializer, TimedSerializerMixin
+from recipes.images import schedule_variants
 from recipes.models import (
-    AmountOfIngredient, FavouriteRecipe, Ingredient, Recipe, ShoppingCart, Tag,
+    FavouriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag,
 )
+from recipes.shopping import change_cart_totals
 from users.models import CustomUser, Follow
 
 
-class TagSerializer(serializers.ModelSerializer):
+class ImageVariantsField(serializers.Field):
+    """URL вариантов изображения: {'preview': {'webp': url, ...}, ...}."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, names in value.items():
+            urls[variant] = {}
+            for image_format, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[variant][image_format] = url
+        return urls
+
+
+class TagSerializer(TimedSerializerMixin,
+                    serializers.ModelSerializer):
     """Сериализатор тэгов."""
 
     class Meta:
         model = Tag
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Сериализатор ингредиентов."""
 
     class Meta:
         model = Ingredient
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
 
 class IngredientAmountSerializer(serializers.ModelSerializer):
     """Сериализатор количества ингредиентов."""
 
-    id = serializers.IntegerField(source='ingredient_recipe.id')
-    name = serializers.CharField(
-        source='ingredient_recipe.name', read_only=True
-    )
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name', read_only=True)
     measurement_unit = serializers.CharField(
-        source='ingredient_recipe.measurement_unit', read_only=True
+        source='ingredient.measurement_unit', read_only=True
     )
 
     class Meta:
-        model = AmountOfIngredient
+        model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
@@ -60,7 +90,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """Сериализатор пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -72,22 +102,78 @@ class CustomUserSerializer(UserSerializer):
             'is_subscribed',
         )
         read_only_fields = 'is_subscribed',
+        list_serializer_class = TimedListSerializer
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        user_subscribed = Follow.objects.filter(user=user, author=obj.id)
-        return user_subscribed.exists()
+        return user_relations(self.context['request']).contains(
+            'follows', obj.id,
+        )
+
+
+class AuthorSerializer(CustomUserSerializer):
+    """Автор рецепта без признака подписки."""
+
+    is_subscribed = None
+
+    class Meta(CustomUserSerializer.Meta):
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Общая для всех пользователей часть рецепта, хранится в кеше.
+
+    Сериализуется без запроса, поэтому адреса изображений относительные.
+    """
+
+    tags = TagSerializer(many=True, read_only=True)
+    author = AuthorSerializer(read_only=True)
+    ingredients = IngredientAmountSerializer(
+        many=True, read_only=True, source='recipe_ingredients',
+    )
+    image = serializers.ImageField(read_only=True)
+    image_variants = ImageVariantsField()
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'tags', 'author', 'ingredients', 'name', 'image',
+            'image_variants', 'text', 'cooking_time',
+        )
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+def render_fragments(recipes):
+    prefetch_related_objects(
+        recipes, 'tags', Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient'),
+        ),
+    )
+    return RecipeFragmentSerializer(recipes, many=True).data
+
+
+class RecipeListSerializer(TimedListSerializer):
+    """Список рецептов: общие части читаются из кеша одним запросом."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        fragments = get_recipe_fragments(recipes, render_fragments)
+        return [
+            self.child.overlay(fragments[recipe.pk], recipe)
+            for recipe in recipes
+        ]
+
+
+class RecipeReadSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Сериализатор чтения рецептов."""
 
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = IngredientAmountSerializer(many=True)
+    ingredients = IngredientAmountSerializer(
+        many=True, source='recipe_ingredients',
+    )
     image = Base64ImageField(max_length=None, use_url=True)
+    image_variants = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -95,22 +181,61 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time',
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        fragments = get_recipe_fragments([instance], render_fragments)
+        return self.overlay(fragments[instance.pk], instance)
+
+    def overlay(self, fragment, instance):
+        """Дополняет общую часть рецепта флагами текущего пользователя."""
+        request = self.context.get('request')
+        data = dict(fragment)
+        data['is_favorited'] = self.get_is_favorited(instance)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(instance)
+        if data['author'] is not None:
+            data['author'] = dict(
+                data['author'], is_subscribed=CustomUserSerializer(
+                    context=self.context
+                ).get_is_subscribed(instance.author),
+            )
+        if request is not None:
+            if data['image']:
+                data['image'] = request.build_absolute_uri(data['image'])
+            data['image_variants'] = {
+                variant: {
+                    image_format: request.build_absolute_uri(url)
+                    for image_format, url in urls.items()
+                }
+                for variant, urls in data['image_variants'].items()
+            }
+        return {field: data[field] for field in self.Meta.fields}
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        favourite = FavouriteRecipe.objects.filter(user=user, recipe=obj)
-        return favourite.exists()
+        return user_relations(self.context['request']).contains(
+            'favourites', obj.pk,
+        )
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        shopping_cart = ShoppingCart.objects.filter(user=user, recipe=obj)
-        return shopping_cart.exists()
+        return user_relations(self.context['request']).contains(
+            'cart', obj.pk,
+        )
+
+
+class RecipeMatchSerializer(RecipeReadSerializer):
+    """Рецепт с покрытием ингредиентами пользователя."""
+
+    def overlay(self, fragment, instance):
+        data = super().overlay(fragment, instance)
+        data.update({
+            'matched': instance.matched,
+            'missing': instance.missing,
+            'coverage': round(instance.coverage, 3),
+        })
+        return data
 
 
 class RecipeWriteSerializer(RecipeReadSerializer):
@@ -124,23 +249,30 @@ class RecipeWriteSerializer(RecipeReadSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time',
         )
 
     def validate(self, data):
-        ingredients_data = data.get('ingredients', None)
+        ingredients_data = data.get('recipe_ingredients', None)
         ingredients_set = set()
         for ingredient in ingredients_data:
             if int(ingredient.get('amount')) <= 0:
                 raise serializers.ValidationError(
                     'Минимальное количество ингридиентов 1'
                 )
-            ingr_obj = ingredient['ingredient_recipe']['id']
+            ingr_obj = ingredient['ingredient']['id']
             if ingr_obj in ingredients_set:
                 raise serializers.ValidationError(
                     'Ингредиент не должен повторяться.'
                 )
             ingredients_set.add(ingr_obj)
+        found = Ingredient.objects.in_bulk(ingredients_set)
+        if len(found) != len(ingredients_set):
+            raise serializers.ValidationError(
+                'Ингредиент не найден: '
+                + ', '.join(map(str, sorted(ingredients_set - set(found))))
+            )
         if len(data['tags']) == 0:
             raise serializers.ValidationError('Отсутствует тэг')
         for tag in data['tags']:
@@ -148,49 +280,54 @@ class RecipeWriteSerializer(RecipeReadSerializer):
                 raise serializers.ValidationError(
                     'Один и тот же тег в данном запросе встречается дважды!'
                 )
-        data['ingredients'] = ingredients_data
+        data['recipe_ingredients'] = ingredients_data
         return data
 
     @staticmethod
-    def create_ingredients(validated_data):
-        validated_ingredients = validated_data.get('ingredients')
-        ingredients_list = []
-        if validated_ingredients:
-            for ingredient in validated_ingredients:
-                ingr_obj = Ingredient.objects.get(
-                    pk=ingredient['ingredient_recipe']['id']
-                )
-                ingr, created = (
-                    AmountOfIngredient.objects.get_or_create(
-                        ingredient_recipe=ingr_obj, amount=ingredient['amount']
-                    )
-                )
-                ingredients_list.append(ingr)
-        return ingredients_list
+    def create_ingredients(recipe, ingredients):
+        """Ингредиенты рецепта одним bulk_create."""
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient['ingredient']['id'],
+                amount=ingredient['amount'],
+            )
+            for ingredient in ingredients
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients = self.create_ingredients(validated_data)
         tags = validated_data.pop('tags')
-        validated_data.pop('ingredients')
-        validated_data.update({'author': self.context['request'].user})
+        ingredients = validated_data.pop('recipe_ingredients')
+        validated_data['author'] = self.context['request'].user
         recipe = Recipe.objects.create(**validated_data)
-        recipe.ingredients.set(ingredients)
+        self.create_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        schedule_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = self.create_ingredients(validated_data)
         tags = validated_data.pop('tags')
-        validated_data.pop('ingredients')
+        ingredients = validated_data.pop('recipe_ingredients')
         validated_data.update({'author': self.context['request'].user})
-        instance.tags.set(tags or instance.tags)
-        instance.ingredients.set(ingredients or instance.ingredients)
-        instance.save()
+        if 'image' in validated_data:
+            validated_data['image_variants'] = {}
+        if tags:
+            instance.tags.set(tags)
+        if ingredients:
+            change_cart_totals([instance.pk], -1)
+            instance.recipe_ingredients.all().delete()
+            self.create_ingredients(instance, ingredients)
+            change_cart_totals([instance.pk], 1)
         updating_data = super(RecipeWriteSerializer, self)
-        return updating_data.update(instance, validated_data)
+        instance = updating_data.update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_variants(instance)
+        return instance
 
 
-class FavouriteRecipeSerializer(serializers.ModelSerializer):
+class FavouriteRecipeSerializer(TimedSerializerMixin,
+                                serializers.ModelSerializer):
     """Сериализатор избранных рецептов."""
 
     id = serializers.CharField(source='recipe.id', read_only=True)
@@ -205,7 +342,17 @@ class FavouriteRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массовых операций."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=1000,
+    )
+
+
+class ShoppingCartSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """Сериализатор списка рецептов для покупок."""
 
     id = serializers.CharField(source='recipe.id', read_only=True)
@@ -218,21 +365,69 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
         fields = ('id', 'name', 'image', 'cooking_time')
+        list_serializer_class = TimedListSerializer
 
 
 class PreviewRecipeSerializer(serializers.ModelSerializer):
     """Превью рецепта."""
 
     image = Base64ImageField(max_length=None, use_url=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class FollowUserSerializer(serializers.ModelSerializer):
-    """Cериализатор подписок пользователей."""
+def recipe_previews(author_ids, limit=None):
+    """Последние рецепты авторов: {author_id: [рецепты]}.
+
+    При заданном limit первые limit рецептов каждого автора отбираются
+    одним запросом с ROW_NUMBER() OVER (PARTITION BY author).
+    """
+    queryset = Recipe.objects.filter(author__in=author_ids).only(
+        'id', 'author', 'name', 'image', 'image_variants', 'cooking_time',
+    )
+    if limit is not None:
+        ranked = queryset.annotate(row_number=Window(
+            RowNumber(), partition_by=F('author_id'),
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).values('id', 'author_id', 'name', 'image', 'image_variants',
+                  'cooking_time', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        queryset = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            f'ORDER BY row_number',
+            (*params, limit),
+        )
+    previews = {}
+    for recipe in queryset:
+        previews.setdefault(recipe.author_id, []).append(recipe)
+    return previews
+
+
+class FollowListSerializer(TimedListSerializer):
+    """Загружает превью рецептов всех авторов страницы одним запросом."""
+
+    def to_representation(self, data):
+        follows = list(data)
+        previews = recipe_previews(
+            {follow.author_id for follow in follows},
+            self.child.get_recipes_limit(),
+        )
+        for follow in follows:
+            follow.author.preview_recipes = previews.get(follow.author_id, [])
+        return super().to_representation(follows)
+
+
+class FollowUserSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
+    """Cериализатор подписок пользователей.
+
+    Параметр запроса recipes_limit ограничивает количество рецептов
+    в выдаче каждого автора.
+    """
 
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
@@ -241,23 +436,28 @@ class FollowUserSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = Follow
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
+        list_serializer_class = FollowListSerializer
+
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.context['request'].query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return limit if limit >= 0 else None
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        favourite = Follow.objects.filter(user=user, author=obj.author)
-        return favourite.exists()
+        return obj.user_id == self.context['request'].user.id
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj.author)
-        preview = PreviewRecipeSerializer(queryset, many=True)
-        return preview.data
-
-    def get_recipes_count(self, obj):
-        recipes = Recipe.objects.filter(author=obj.author)
-        return recipes.count()
+        recipes = getattr(obj.author, 'preview_recipes', None)
+        if recipes is None:
+            recipes = recipe_previews(
+                [obj.author_id], self.get_recipes_limit()
+            ).get(obj.author_id, [])
+        return PreviewRecipeSerializer(recipes, many=True).data
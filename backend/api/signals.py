@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.cache import bump_catalog_version, invalidate_user_relations
+from api.serializers import AuthorSerializer
+from recipes.models import (
+    FavouriteRecipe, Ingredient, Recipe, ShoppingCart, Tag,
+)
+from recipes.relations import relations_changed
+from recipes.signals import catalog_loaded
+from users.models import CustomUser, Follow
+
+
+@receiver([post_save, post_delete, catalog_loaded], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_catalog_version('tags')
+    bump_catalog_version('recipes')
+
+
+@receiver([post_save, post_delete, catalog_loaded], sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_catalog_version('ingredients')
+    bump_catalog_version('recipes')
+
+
+def touch_recipes(recipes):
+    """Обновляет время изменения рецептов, а с ним и ключи их кеша."""
+    recipes.update(updated=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_relations(sender, instance, action, **kwargs):
+    # Правка рецепта через save() меняет ключ его кеша сама, тэги
+    # меняются отдельно от рецепта.
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Recipe):
+        touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    else:
+        bump_catalog_version('recipes')
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_recipes(sender, instance, created, update_fields=None,
+                              **kwargs):
+    """Сбрасывает рецепты автора при изменении его публичных данных."""
+    if created or (update_fields is not None and not set(update_fields)
+                   & set(AuthorSerializer.Meta.fields)):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens(sender, instance, created, update_fields=None,
+                           **kwargs):
+    """Сбрасывает токены пользователя при изменении его данных.
+
+    Пароль, is_active и профиль меняются через save(); обновление
+    только last_login при входе кеш не затрагивает.
+    """
+    if created or update_fields is not None and set(update_fields) <= {
+        'last_login',
+    }:
+        return
+    invalidate_tokens(Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ))
+
+
+def schedule_relations_invalidation(user_id):
+    transaction.on_commit(lambda: invalidate_user_relations(user_id))
+
+
+@receiver(relations_changed)
+def invalidate_relations(sender, user, **kwargs):
+    schedule_relations_invalidation(user.pk)
+
+
+@receiver([post_save, post_delete], sender=FavouriteRecipe)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_relation(sender, instance, batched=False, **kwargs):
+    # Админка, create()/delete() и каскадное удаление; вызовы
+    # add_relations/remove_relations обрабатывает invalidate_relations.
+    if not batched:
+        schedule_relations_invalidation(instance.user_id)
@@ -0,0 +1,341 @@
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.authentication import USER_FIELDS, get_token_user, token_users
+from api.cache import UserRelations, invalidate_user_relations
+from api.metrics import RENDERER_DURATION, SERIALIZER_DURATION
+from recipes.models import (
+    FavouriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, Tag,
+)
+from recipes.search import INDEX_TIMEOUT, INDEX_VERSION_KEY, ingredient_index
+from recipes.shopping import mismatched_users
+from users.models import CustomUser, Follow
+
+
+class FoodgramTestCase(APITestCase):
+    """Справочники, два автора и дюжина рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', color='#E26C2D',
+                               slug='breakfast'),
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('мука', 'г'), ('молоко', 'мл'),
+                               ('яйца', 'шт.'))
+        ]
+        cls.user, cls.author = [
+            CustomUser.objects.create_user(
+                username=name, email=f'{name}@example.org', password='pass',
+                first_name=name, last_name=name,
+            )
+            for name in ('user', 'author')
+        ]
+        cls.token = Token.objects.create(user=cls.user)
+        cls.recipes = []
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.author if number % 2 else cls.user,
+                name=f'Рецепт {number}', text='Текст', cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            recipe.tags.set(cls.tags[:number % 2 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in cls.ingredients[:2]
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        token_users.delete([self.token.key])
+
+    def login(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeListQueriesTest(FoodgramTestCase):
+    """Число запросов ленты рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        FavouriteRecipe.objects.create(user=cls.user, recipe=cls.recipes[11])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[9])
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def list_queries(self, cold, warm):
+        """cold запросов с пустым кешем и warm - с заполненным."""
+        for limit in (2, 10):
+            cache.clear()
+            token_users.delete([self.token.key])
+            for queries in (cold, warm):
+                with self.subTest(limit=limit, queries=queries):
+                    with self.assertNumQueries(queries):
+                        response = self.client.get(
+                            f'/api/recipes/?limit={limit}',
+                        )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+        return response.data['results']
+
+    def test_anonymous(self):
+        # COUNT(*), страница, тэги и ингредиенты общих частей рецептов.
+        self.list_queries(4, 2)
+
+    def test_authenticated(self):
+        # Плюс токен и связи пользователя: избранное, корзина, подписки.
+        self.login()
+        results = self.list_queries(8, 2)
+        flags = {
+            recipe['id']: (recipe['is_favorited'],
+                           recipe['is_in_shopping_cart'],
+                           recipe['author']['is_subscribed'])
+            for recipe in results
+        }
+        self.assertEqual(flags[self.recipes[11].pk], (True, False, True))
+        self.assertEqual(flags[self.recipes[9].pk], (False, True, True))
+        self.assertEqual(flags[self.recipes[10].pk], (False, False, False))
+
+
+class CatalogCacheTest(FoodgramTestCase):
+    """Кеш справочников сбрасывается при их изменении."""
+
+    def test_tags(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        self.assertEqual(len(response.json()), 2)
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class RecipeCacheTest(FoodgramTestCase):
+    """Общие части рецептов в кеше не переживают изменений рецепта."""
+
+    def get_recipe(self, recipe):
+        response = self.client.get('/api/recipes/?limit=20')
+        return next(data for data in response.data['results']
+                    if data['id'] == recipe.pk)
+
+    def test_recipe_changes(self):
+        recipe = self.recipes[0]
+        self.assertEqual(self.get_recipe(recipe)['name'], 'Рецепт 0')
+        recipe.name = 'Блины'
+        recipe.save()
+        self.assertEqual(self.get_recipe(recipe)['name'], 'Блины')
+        recipe.tags.set(self.tags)
+        self.assertEqual(len(self.get_recipe(recipe)['tags']), 2)
+
+    def test_author_changes(self):
+        recipe = self.recipes[1]
+        self.get_recipe(recipe)
+        self.author.first_name = 'Шеф'
+        self.author.save()
+        self.assertEqual(self.get_recipe(recipe)['author']['first_name'],
+                         'Шеф')
+
+    def test_tag_changes(self):
+        recipe = self.recipes[0]
+        self.get_recipe(recipe)
+        self.tags[0].name = 'Бранч'
+        self.tags[0].save()
+        self.assertEqual(self.get_recipe(recipe)['tags'][0]['name'], 'Бранч')
+
+
+class MatchTest(FoodgramTestCase):
+    """Подбор рецептов по имеющимся ингредиентам."""
+
+    def test_empty_have(self):
+        for query in ('', '?have=', '?have=,', '?have=,&have='):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/match/{query}')
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/recipes/match/?have=x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_match(self):
+        flour, milk, _ = self.ingredients
+        response = self.client.get(
+            f'/api/recipes/match/?have={flour.pk},{milk.pk}&limit=3',
+        )
+        self.assertEqual(response.status_code, 200)
+        for recipe in response.data['results']:
+            self.assertEqual(recipe['coverage'], 1)
+
+
+class TokenCacheTest(FoodgramTestCase):
+    """Кеш токенов не хранит пароль и не мешает его смене."""
+
+    def test_cached_user(self):
+        self.login()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        values = dict(zip(USER_FIELDS, get_token_user(self.token.key)))
+        self.assertNotIn('password', values)
+        self.assertEqual(values['email'], self.user.email)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['username'], 'user')
+
+    def test_set_password(self):
+        self.login()
+        self.client.get('/api/users/me/')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'n3w-Passw0rd',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3w-Passw0rd'))
+
+    @override_settings(TOKEN_CACHE_SHARED=True)
+    def test_shared_invalidation(self):
+        self.login()
+        self.client.get('/api/users/me/')
+        values = get_token_user(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        # Кеш другого процесса, который ещё помнит токен.
+        token_users.set(self.token.key, values)
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+
+class UserRelationsTest(FoodgramTestCase):
+    """Флаги пользователя в ленте следуют за его действиями."""
+
+    def flags(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        return (response.data['is_favorited'],
+                response.data['is_in_shopping_cart'])
+
+    def test_toggle(self):
+        self.login()
+        recipe = self.recipes[1]
+        self.assertEqual(self.flags(recipe), (False, False))
+        for url in ('favorite', 'shopping_cart'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    f'/api/recipes/{recipe.pk}/{url}/',
+                )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.flags(recipe), (True, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertEqual(self.flags(recipe), (False, True))
+
+    def test_orm_changes(self):
+        # Админка и каскадное удаление работают через ORM.
+        self.login()
+        recipe = self.recipes[1]
+        self.assertEqual(self.flags(recipe), (False, False))
+        with self.captureOnCommitCallbacks(execute=True):
+            FavouriteRecipe.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.assertEqual(self.flags(recipe), (True, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            FavouriteRecipe.objects.filter(user=self.user).delete()
+        self.assertEqual(self.flags(recipe), (False, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.delete()
+        relations = UserRelations(self.user)
+        self.assertFalse(relations.contains('cart', recipe.pk))
+
+    def test_stale_array_is_not_read(self):
+        # Массив, прочитанный до фиксации и сохранённый после сброса,
+        # лежит под старой версией.
+        stale = UserRelations(self.user)
+        stale.load()
+        FavouriteRecipe.objects.create(user=self.user, recipe=self.recipes[0])
+        invalidate_user_relations(self.user.pk)
+        relations = UserRelations(self.user)
+        self.assertTrue(relations.contains('favourites', self.recipes[0].pk))
+
+
+class ShoppingListTest(FoodgramTestCase):
+    """Материализованный список покупок совпадает с корзиной."""
+
+    def test_cart_changes(self):
+        self.login()
+        first, second = self.recipes[0], self.recipes[1]
+        for recipe in (first, second):
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertEqual(mismatched_users(), [])
+        totals = {
+            item.ingredient_id: item.total_amount
+            for item in ShoppingListItem.objects.filter(user=self.user)
+        }
+        # Количества ингредиентов рецепта N равны N + 1.
+        self.assertEqual(totals, {
+            ingredient.pk: 3 for ingredient in self.ingredients[:2]
+        })
+        self.client.delete(f'/api/recipes/{first.pk}/shopping_cart/')
+        second.delete()
+        self.assertEqual(mismatched_users(), [])
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.user))
+
+    def test_orm_changes(self):
+        # Админка, create()/delete() и каскадное удаление.
+        other = CustomUser.objects.create_user(
+            username='other', email='other@example.org', password='pass',
+        )
+        for user in (self.user, other):
+            for recipe in self.recipes[:3]:
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+        self.assertEqual(mismatched_users(), [])
+        ShoppingCart.objects.filter(recipe=self.recipes[0]).delete()
+        self.assertEqual(mismatched_users(), [])
+        self.recipes[1].delete()
+        self.assertEqual(mismatched_users(), [])
+        self.author.delete()
+        other.delete()
+        self.assertEqual(mismatched_users(), [])
+        self.assertEqual(ShoppingListItem.objects.count(), 2)
+
+
+class IngredientSearchTest(FoodgramTestCase):
+    """Индекс ингредиентов в памяти видит изменения других процессов."""
+
+    def names(self, term):
+        response = self.client.get(f'/api/ingredients/?name={term}')
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_other_process_changes(self):
+        self.assertEqual(self.names('мо'), ['молоко'])
+        # Ингредиенты, добавленные в обход сигналов, и версия индекса,
+        # увеличенная другим процессом (например, load_catalog).
+        Ingredient.objects.bulk_create([
+            Ingredient(name='морковь', measurement_unit='г'),
+        ])
+        self.assertEqual(self.names('мо'), ['молоко'])
+        cache.set(INDEX_VERSION_KEY, 'load_catalog')
+        self.assertEqual(self.names('мо'), ['молоко', 'морковь'])
+
+    def test_timeout(self):
+        self.names('мо')
+        Ingredient.objects.bulk_create([
+            Ingredient(name='морковь', measurement_unit='г'),
+        ])
+        ingredient_index._loaded -= INDEX_TIMEOUT + 1
+        self.assertEqual(self.names('мо'), ['молоко', 'морковь'])
+
+
+class MetricsTest(FoodgramTestCase):
+    """Сериализация и рендеринг ответа учитываются раздельно."""
+
+    def test_serializer_duration(self):
+        self.client.get('/api/recipes/?limit=10')
+        labels = ('RecipeViewSet', 'list')
+        # Последний элемент гистограммы - сумма наблюдений.
+        self.assertGreater(SERIALIZER_DURATION.values[labels][-1], 0)
+        self.assertGreater(RENDERER_DURATION.values[labels][-1], 0)
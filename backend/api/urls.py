@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework import routers
 
 from api.views import (
-    FollowUserViewSet, IngredientViewSet, RecipeViewSet, TagViewSet,
+    FollowUserViewSet, IngredientViewSet, MetricsView, RecipeViewSet,
+    TagViewSet,
 )
 
 app_name = 'api'
@@ -27,6 +28,7 @@ router.register('recipes', RecipeViewSet, basename='recipe')
 
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
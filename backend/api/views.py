@@ -1,30 +1,54 @@
-from io import StringIO
+from hashlib import md5
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.cache import CachedCatalogMixin, recipe_cache_stats
 from api.filters import IngredientSearchFilter, RecipeFilter
+from api.metrics import expose
+from api.pagination import (
+    KeysetPagination, PageLimitPagination, RecipePagination,
+)
 from api.permissions import AdminAuthorOrReadOnly, IsAuthor
+from api.renderers import SHOPPING_LIST_RENDERERS, PrometheusRenderer
 from api.serializers import (
     FavouriteRecipeSerializer, FollowUserSerializer, IngredientSerializer,
-    RecipeReadSerializer, RecipeWriteSerializer, ShoppingCartSerializer,
-    TagSerializer,
+    RecipeIdsSerializer, RecipeMatchSerializer, RecipeReadSerializer,
+    RecipeWriteSerializer, ShoppingCartSerializer, TagSerializer,
 )
+from recipes import transfer
 from recipes.models import (
-    AmountOfIngredient, FavouriteRecipe, Ingredient, Recipe, ShoppingCart, Tag,
+    FavouriteRecipe, Ingredient, Recipe, ShoppingCart, Tag,
 )
+from recipes.relations import add_relations, remove_relations
+from recipes.shopping import cart_ingredients
+from recipes.units import humanize_rows
 from users.models import CustomUser, Follow
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def parse_id(value):
+    """Целочисленный id из URL, иначе 404."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+class TagViewSet(CachedCatalogMixin, viewsets.ReadOnlyModelViewSet):
     """Представление тегов. /tags/"""
 
     queryset = Tag.objects.all()
@@ -33,117 +57,244 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [SearchFilter, ]
     search_fields = ['^name', ]
     throttle_scope = 'tags'
+    catalog_name = 'tags'
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedCatalogMixin, viewsets.ReadOnlyModelViewSet):
     """Ингредиенты. /ingredients/"""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = [IngredientSearchFilter, ]
-    search_fields = ['^name', '$name', ]
     throttle_scope = 'ingredients'
+    catalog_name = 'ingredients'
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Рецепты. /recipes/"""
 
-    queryset = Recipe.objects.all()
     permission_classes = [AdminAuthorOrReadOnly, ]
+    pagination_class = RecipePagination
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
     throttle_scope = 'recipes'
 
+    def get_queryset(self):
+        """Рецепты с автором.
+
+        Флаги избранного, корзины и подписки на автора проверяются
+        по кешу связей пользователя (api.cache.UserRelations). Тэги
+        и ингредиенты входят в кешируемую часть рецепта и загружаются
+        только при промахе кеша, поэтому число запросов на страницу
+        не зависит от её размера.
+        """
+        return Recipe.objects.select_related('author').defer('search_vector')
+
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH']:
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
-    @action(methods=['POST', 'DELETE'], detail=True, url_path='favorite',
-            permission_classes=[IsAuthenticated, ])
-    def favorite(self, request, pk):
-        user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
+    @action(methods=['GET'], detail=False, url_path='match',
+            pagination_class=PageLimitPagination)
+    def match(self, request):
+        """Рецепты по ингредиентам, которые есть у пользователя.
+
+        /recipes/match/?have=12,57,301 - от наибольшего покрытия.
+        """
+        filterset = RecipeFilter(request.query_params, request=request)
+        if filterset.is_valid() and not filterset.form.cleaned_data['have']:
+            # Проверяется разобранный список: "?have=," - тоже пустой.
+            raise ValidationError({'have': 'Укажите id ингредиентов.'})
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeMatchSerializer(
+            page, many=True, context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['POST'], detail=False, url_path='import',
+            permission_classes=[IsAuthenticated],
+            parser_classes=[MultiPartParser])
+    def import_recipes(self, request):
+        """Массовый импорт рецептов пользователя из файла file.
+
+        Файл - NDJSON или tar в формате команды import_recipes. Строки
+        с ошибками пропускаются и возвращаются с номерами.
+        """
+        file = request.FILES.get('file')
+        if file is None:
+            raise ValidationError({'file': 'Загрузите файл NDJSON или tar.'})
+        try:
+            source = transfer.RecipeSource(file, file.name)
+        except ValueError as error:
+            raise ValidationError({'file': str(error)})
+        created, errors = transfer.import_recipes(source, request.user)
+        return Response(
+            {
+                'created': created,
+                'errors': [{'line': number, 'errors': line_errors}
+                           for number, line_errors in errors],
+            },
+            status=status.HTTP_201_CREATED if created
+            else status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(methods=['GET'], detail=False, url_path='cache_stats',
+            permission_classes=[IsAdminUser, ])
+    def cache_stats(self, request):
+        """Попадания и промахи кеша рецептов в этом процессе."""
+        return Response(recipe_cache_stats)
+
+    def toggle_relation(self, request, pk, model, serializer_class,
+                        exists_message, missing_message):
+        """Добавляет (POST) или удаляет (DELETE) рецепт из списка model.
+
+        Каждая операция - одна команда INSERT или DELETE, существование
+        рецепта проверяется отдельно только при неудаче.
+        """
+        recipe_id = parse_id(pk)
         if request.method == 'POST':
-            recipe_favorite, created = FavouriteRecipe.objects.get_or_create(
-                user=user, recipe=recipe
-            )
+            created = add_relations(model, request.user, 'recipe', [recipe_id])
             if created:
-                serializer = FavouriteRecipeSerializer()
-                return Response(
-                    serializer.to_representation(instance=recipe_favorite),
-                    status=status.HTTP_201_CREATED,
+                relation = created[0]
+                relation.recipe = get_object_or_404(
+                    Recipe.objects.only('name', 'image', 'cooking_time'),
+                    pk=recipe_id,
                 )
-            fav = FavouriteRecipe.objects.filter(user=user, recipe=recipe)
-            if fav.exists():
                 return Response(
-                    'Рецепт уже есть в списке избранного',
-                    status=status.HTTP_400_BAD_REQUEST
+                    serializer_class(relation).data,
+                    status=status.HTTP_201_CREATED,
                 )
-        elif request.method == 'DELETE':
-            fav = FavouriteRecipe.objects.filter(user=user, recipe=recipe)
-            if fav.exists():
-                fav.delete()
+            message = exists_message
+        else:
+            if remove_relations(model, request.user, 'recipe', [recipe_id]):
                 return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(
-                'Отсутствует рецепт для удаления из списка избранного',
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+            message = missing_message
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            raise Http404
+        return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['POST', 'DELETE'], detail=True, url_path='favorite',
+            permission_classes=[IsAuthenticated, ])
+    def favorite(self, request, pk):
+        return self.toggle_relation(
+            request, pk, FavouriteRecipe, FavouriteRecipeSerializer,
+            'Рецепт уже есть в списке избранного',
+            'Отсутствует рецепт для удаления из списка избранного',
+        )
 
     @action(methods=['POST', 'DELETE'], detail=True,
             url_path='shopping_cart', permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk):
-        user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if request.method == 'POST':
-            recipe_shop, created = ShoppingCart.objects.get_or_create(
-                user=user, recipe=recipe
-            )
-            if created:
-                serializer = ShoppingCartSerializer()
-                return Response(
-                    serializer.to_representation(instance=recipe_shop),
-                    status=status.HTTP_201_CREATED
-                )
-            return Response(
-                'Рецепт уже в корзине покупок',
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        elif request.method == 'DELETE':
-            shop = ShoppingCart.objects.filter(user=user, recipe=recipe)
-            if shop.exists():
-                shop.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(
-                'Отсутствует рецепт для удаления из списка покупок',
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        return self.toggle_relation(
+            request, pk, ShoppingCart, ShoppingCartSerializer,
+            'Рецепт уже в корзине покупок',
+            'Отсутствует рецепт для удаления из списка покупок',
+        )
 
-    @action(methods=['GET'], detail=False, url_path='download_shopping_cart',
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='shopping_cart/bulk',
             permission_classes=[IsAuthenticated])
+    def shopping_cart_bulk(self, request):
+        """Добавляет или удаляет несколько рецептов списка покупок.
+
+        Тело запроса: {"recipes": [id, ...]}. Несуществующие рецепты
+        и уже добавленные (или отсутствующие при удалении) пропускаются.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'DELETE':
+            remove_relations(ShoppingCart, request.user, 'recipe', recipe_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        created = add_relations(
+            ShoppingCart, request.user, 'recipe', recipe_ids,
+        )
+        recipes = Recipe.objects.only(
+            'name', 'image', 'cooking_time'
+        ).in_bulk([relation.recipe_id for relation in created])
+        for relation in created:
+            relation.recipe = recipes[relation.recipe_id]
+        return Response(
+            ShoppingCartSerializer(created, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    def cart_validators(self, request, variant):
+        """ETag и Last-Modified списка покупок.
+
+        Вычисляются по последнему изменению корзины, variant различает
+        представления списка (форматы файла, summary).
+        """
+        state = ShoppingCart.objects.filter(user=request.user).aggregate(
+            count=Count('id'), added=Max('added'),
+            updated=Max('recipe__updated'),
+        )
+        changes = [state['added'], state['updated']]
+        last_modified = max(filter(None, changes), default=None)
+        last_modified = last_modified and int(last_modified.timestamp())
+        etag = quote_etag(md5(
+            f'{variant}:{state["count"]}:{changes}'.encode()
+        ).hexdigest())
+        return etag, last_modified
+
+    def set_cart_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(methods=['GET'], detail=False, url_path='download_shopping_cart',
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
-        cart_file = StringIO()
-        ingredients = AmountOfIngredient.objects.filter(
-            recipes__shopcart__user=request.user
-        ).values(
-            'ingredient_recipe__name', 'ingredient_recipe__measurement_unit'
-        ).annotate(ingredient_amount=Sum('amount')).values_list(
-            'ingredient_recipe__name', 'ingredient_recipe__measurement_unit',
-            'amount'
+        """Список покупок в формате ?format=txt|csv|json.
+
+        Суммирование выполняется в БД, результат читается курсором
+        и отдаётся потоком. ETag и Last-Modified вычисляются по последнему
+        изменению корзины, повторная загрузка получает 304.
+        """
+        renderer = request.accepted_renderer
+        etag, last_modified = self.cart_validators(request, renderer.format)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+        )
+        if response is not None:
+            return response
+        rows = cart_ingredients(request.user).iterator(chunk_size=500)
+        if isinstance(request._request, ASGIRequest):
+            # Django 3.2 перебирает потоковый ответ в цикле событий,
+            # где запросы к БД запрещены: строки читаются заранее.
+            rows = list(rows)
+        response = StreamingHttpResponse(
+            renderer.stream(humanize_rows(rows)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
         )
-        cart_file.write('Нужно купить: \n')
-        cart_file.write('\n'.join([
-            f'{ingredient[0]}: {ingredient[2]} {ingredient[1]}'
-            for ingredient in ingredients
-        ]))
-        response = HttpResponse(cart_file.getvalue(), content_type='text',)
         response['Content-Disposition'] = (
-            'attachment; filename="%s"' % 'cart_file.txt'
+            f'attachment; filename="cart_file.{renderer.format}"'
         )
-        return response
+        return self.set_cart_validators(response, etag, last_modified)
+
+    @action(methods=['GET'], detail=False, url_path='shopping_cart/summary',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_summary(self, request):
+        """Суммы ингредиентов корзины в JSON с переводом единиц.
+
+        [{"name": ..., "measurement_unit": ..., "amount": ...}, ...],
+        с теми же ETag и Last-Modified, что у download_shopping_cart.
+        """
+        etag, last_modified = self.cart_validators(request, 'summary')
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+        )
+        if response is None:
+            response = Response(
+                list(humanize_rows(cart_ingredients(request.user)))
+            )
+        return self.set_cart_validators(response, etag, last_modified)
 
 
 class FollowUserViewSet(UserViewSet):
@@ -152,10 +303,13 @@ class FollowUserViewSet(UserViewSet):
     throttle_scope = 'follows'
 
     @action(methods=['GET'], detail=False, url_path='subscriptions',
-            permission_classes=[IsAuthor, ])
+            permission_classes=[IsAuthor, ],
+            pagination_class=KeysetPagination)
     def subscriptions(self, request):
         user = request.user
-        user_follows = Follow.objects.filter(user=user)
+        user_follows = Follow.objects.filter(user=user).select_related(
+            'author'
+        )
         pages = self.paginate_queryset(user_follows)
         serializer = FollowUserSerializer(
             pages, many=True, context={'request': request},
@@ -165,36 +319,39 @@ class FollowUserViewSet(UserViewSet):
     @action(methods=['POST', 'DELETE'], detail=True, url_path='subscribe',
             permission_classes=[IsAuthenticated, ])
     def subscribe(self, request, id=None):
-        if request.method == 'POST':
-            user = request.user
-            author = get_object_or_404(CustomUser, id=id)
-            if user == author:
-                return Response(
-                    'Нельзя подписаться/отписаться на себя',
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            follow_user = Follow.objects.filter(user=user, author=author)
-            if follow_user.exists():
-                return Response(
-                    'Вы уже подписаны', status=status.HTTP_400_BAD_REQUEST)
-            follow = Follow.objects.create(user=user, author=author)
-            serializer = FollowUserSerializer(
-                follow, context={'request': request},
+        user = request.user
+        author_id = parse_id(id)
+        if user.id == author_id:
+            return Response(
+                'Нельзя подписаться/отписаться на себя',
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        elif request.method == 'DELETE':
-            user = request.user
-            author = get_object_or_404(CustomUser, id=id)
-            if user == author:
-                return Response(
-                    'Нельзя подписаться/отписаться на себя',
-                    status=status.HTTP_400_BAD_REQUEST,
+        if request.method == 'POST':
+            created = add_relations(Follow, user, 'author', [author_id])
+            if created:
+                follow = created[0]
+                follow.author = get_object_or_404(CustomUser, id=author_id)
+                serializer = FollowUserSerializer(
+                    follow, context={'request': request},
                 )
-            follow_user = Follow.objects.filter(user=user, author=author)
-            if not follow_user.exists():
                 return Response(
-                    'Вы не подписаны', status=status.HTTP_400_BAD_REQUEST,
+                    serializer.data, status=status.HTTP_201_CREATED,
                 )
-            follow_user.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            message = 'Вы уже подписаны'
+        else:
+            if remove_relations(Follow, user, 'author', [author_id]):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            message = 'Вы не подписаны'
+        if not CustomUser.objects.filter(id=author_id).exists():
+            raise Http404
+        return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+
+class MetricsView(APIView):
+    """Метрики процесса для Prometheus."""
+
+    permission_classes = [IsAdminUser, ]
+    renderer_classes = [PrometheusRenderer, ]
+
+    def get(self, request):
+        return Response(expose())
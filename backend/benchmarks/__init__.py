@@ -0,0 +1,51 @@
+"""Бенчмарки API.
+
+Запускаются из каталога backend:
+
+python -m benchmarks.recipe_filter --recipes 100000  # план фильтрации
+python -m benchmarks.api --output api.json           # время и запросы
+python -m benchmarks.seed --output seed.json         # данные для load
+python -m benchmarks.load seed.json --output load.json
+python -m benchmarks.compare before.json after.json
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    os.environ.setdefault('DISABLE_THROTTLING', '1')
+    django.setup()
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, benchmark, results, options, database=None):
+    """Сохраняет результаты в JSON вместе с условиями запуска."""
+    if database is None:
+        from django.db import connection
+        database = connection.vendor
+    report = {
+        'benchmark': benchmark,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': revision(),
+        'python': platform.python_version(),
+        'database': database,
+        'options': vars(options),
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
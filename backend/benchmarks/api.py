@@ -0,0 +1,159 @@
+"""Время и число SQL-запросов основных эндпоинтов API.
+
+Запросы выполняются тестовым клиентом в том же процессе, данные
+генерируются внутри транзакции, которая откатывается в конце. Для
+каждого эндпоинта записываются первый запуск с пустым кешем (cold)
+и медиана и 95-й перцентиль повторных запусков.
+
+python -m benchmarks.api --recipes 10000 --output api.json
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup, write_results
+
+# Эндпоинт: (название, [(метод, URL), ...]). Операция-переключатель
+# (добавить и удалить) измеряется как пара запросов.
+ENDPOINTS = (
+    ('recipes_list', [('get', '/api/recipes/')]),
+    ('recipes_list_anonymous', [('get', '/api/recipes/')]),
+    ('recipes_list_keyset', [('get', '/api/recipes/?cursor=')]),
+    ('recipe_detail', [('get', '/api/recipes/{recipe}/')]),
+    ('recipes_filtered', [
+        ('get', '/api/recipes/?tags={tag}&is_favorited=1'),
+    ]),
+    ('recipes_popular', [('get', '/api/recipes/?ordering=popular')]),
+    ('recipes_search', [('get', '/api/recipes/?search=рецепт')]),
+    ('recipes_match', [('get', '/api/recipes/match/?have={ingredients}')]),
+    ('subscriptions', [
+        ('get', '/api/users/subscriptions/?recipes_limit=3'),
+    ]),
+    ('download_shopping_cart', [
+        ('get', '/api/recipes/download_shopping_cart/'),
+    ]),
+    ('favorite_toggle', [
+        ('post', '/api/recipes/{other_recipe}/favorite/'),
+        ('delete', '/api/recipes/{other_recipe}/favorite/'),
+    ]),
+    ('shopping_cart_toggle', [
+        ('post', '/api/recipes/{other_recipe}/shopping_cart/'),
+        ('delete', '/api/recipes/{other_recipe}/shopping_cart/'),
+    ]),
+    ('subscribe_toggle', [
+        ('post', '/api/users/{other_user}/subscribe/'),
+        ('delete', '/api/users/{other_user}/subscribe/'),
+    ]),
+)
+
+
+def request_once(client, requests):
+    """Выполняет запросы, возвращает (время в мс, число SQL-запросов)."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for method, url in requests:
+            response = getattr(client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f'{method.upper()} {url}: {response.status_code}'
+                )
+        elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, len(queries)
+
+
+def measure(client, requests, repeat):
+    from django.core.cache import cache
+
+    cache.clear()
+    cold, cold_queries = request_once(client, requests)
+    timings, queries = [], 0
+    for _ in range(repeat):
+        elapsed, queries = request_once(client, requests)
+        timings.append(elapsed)
+    timings.sort()
+    return {
+        'cold_ms': round(cold, 2),
+        'cold_queries': cold_queries,
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[int(0.95 * (len(timings) - 1))], 2),
+        'queries': queries,
+    }
+
+
+def run(options):
+    from django.db import transaction
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    from benchmarks.data import generate
+    from recipes.models import RecipeIngredient, ShoppingCart, Tag
+
+    results = {}
+    with transaction.atomic():
+        started = time.perf_counter()
+        data = generate(
+            users=options.users, recipes=options.recipes,
+            favourites_per_user=options.favourites,
+            carts_per_user=options.carts, follows_per_user=options.follows,
+        )
+        print(f'Данные: {options.recipes} рецептов за '
+              f'{time.perf_counter() - started:.1f} с')
+        user, other_user = data['users'][:2]
+        in_cart = set(ShoppingCart.objects.filter(user=user).values_list(
+            'recipe', flat=True
+        ))
+        context = {
+            'recipe': data['recipes'][0],
+            'other_recipe': next(
+                pk for pk in data['recipes'] if pk not in in_cart
+            ),
+            'other_user': other_user,
+            'tag': Tag.objects.get(pk=data['tags'][0]).slug,
+            'ingredients': ','.join(map(str, RecipeIngredient.objects.filter(
+                recipe=data['recipes'][0],
+            ).values_list('ingredient', flat=True)[:3])),
+        }
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.create(user_id=user).key
+        ))
+        anonymous = APIClient()
+        for name, requests in ENDPOINTS:
+            requests = [
+                (method, url.format(**context)) for method, url in requests
+            ]
+            results[name] = measure(
+                anonymous if name.endswith('anonymous') else client,
+                requests, options.repeat,
+            )
+            print('{:<24} {cold_ms:>9.2f} {median_ms:>9.2f} {p95_ms:>9.2f} '
+                  '{queries:>5}'.format(name, **results[name]))
+        transaction.set_rollback(True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--favourites', type=int, default=20)
+    parser.add_argument('--carts', type=int, default=5)
+    parser.add_argument('--follows', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Файл для результатов в JSON.')
+    options = parser.parse_args()
+    setup()
+    print(f'{"эндпоинт":<24} {"cold, мс":>9} {"медиана":>9} {"p95":>9} '
+          f'{"SQL":>5}')
+    results = run(options)
+    if options.output:
+        write_results(options.output, 'api', results, options)
+
+
+if __name__ == '__main__':
+    main()
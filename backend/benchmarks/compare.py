@@ -0,0 +1,39 @@
+"""Сравнение двух JSON-отчётов одного бенчмарка.
+
+python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    options = parser.parse_args()
+    before, after = load(options.before), load(options.after)
+    if before['benchmark'] != after['benchmark']:
+        parser.error('Отчёты разных бенчмарков: '
+                     f'{before["benchmark"]} и {after["benchmark"]}')
+    print(f'{before["revision"]} ({before["database"]}) -> '
+          f'{after["revision"]} ({after["database"]})')
+    for name, result in after['results'].items():
+        previous = before['results'].get(name)
+        if previous is None:
+            continue
+        for metric, value in result.items():
+            old = previous.get(metric)
+            if not isinstance(value, (int, float)) or not old:
+                continue
+            change = (value - old) / old * 100
+            print(f'{name:<24} {metric:<22} {old:>10} {value:>10} '
+                  f'{change:>+8.1f}%')
+
+
+if __name__ == '__main__':
+    main()
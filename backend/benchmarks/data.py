@@ -0,0 +1,113 @@
+import json
+import os
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection
+
+from recipes.counters import COUNTERS, recount
+from recipes.models import (
+    FavouriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag,
+)
+from recipes.scores import recompute_scores
+from recipes.search import update_search_index
+from recipes.shopping import rebuild_shopping_lists
+from users.models import Follow
+
+User = get_user_model()
+
+INGREDIENTS_FILE = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+AMOUNTS = (1, 2, 5, 10, 50, 100, 200, 500)
+BATCH_SIZE = 5000
+
+
+def next_id(model):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+def insert(model, objects):
+    """bulk_create с явными pk и сбросом последовательности."""
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+            cursor.execute(sql)
+
+
+def load_ingredients():
+    if not Ingredient.objects.exists():
+        with open(INGREDIENTS_FILE, encoding='utf-8') as file:
+            rows = json.load(file)
+        Ingredient.objects.bulk_create(
+            [Ingredient(**row) for row in rows], batch_size=BATCH_SIZE,
+        )
+    return list(Ingredient.objects.values_list('pk', flat=True))
+
+
+def generate(users=100, recipes=1000, tags=8, ingredients_per_recipe=6,
+             tags_per_recipe=2, favourites_per_user=20, carts_per_user=5,
+             follows_per_user=5, seed=0):
+    """Заполняет БД детерминированным набором данных.
+
+    Возвращает словарь со списками pk созданных объектов.
+    """
+    rng = random.Random(seed)
+    ingredient_ids = load_ingredients()
+
+    start = next_id(Tag)
+    tag_ids = list(range(start, start + tags))
+    insert(Tag, [
+        Tag(pk=pk, name=f'bench-{pk}', slug=f'bench-{pk}',
+            color=f'#{pk:06X}'[-7:])
+        for pk in tag_ids
+    ])
+
+    start = next_id(User)
+    user_ids = list(range(start, start + users))
+    insert(User, [
+        User(pk=pk, username=f'bench{pk}', email=f'bench{pk}@example.org',
+             first_name='Bench', last_name=str(pk), password='!')
+        for pk in user_ids
+    ])
+
+    start = next_id(Recipe)
+    recipe_ids = list(range(start, start + recipes))
+    insert(Recipe, [
+        Recipe(pk=pk, author_id=rng.choice(user_ids), name=f'Рецепт {pk}',
+               text='Описание рецепта', image='recipe_images/bench.png',
+               cooking_time=rng.randint(1, 120))
+        for pk in recipe_ids
+    ])
+    tag_links, ingredient_links = [], []
+    for pk in recipe_ids:
+        for tag in rng.sample(tag_ids, min(tags_per_recipe, len(tag_ids))):
+            tag_links.append(Recipe.tags.through(recipe_id=pk, tag_id=tag))
+        for ingredient in rng.sample(ingredient_ids, ingredients_per_recipe):
+            ingredient_links.append(RecipeIngredient(
+                recipe_id=pk, ingredient_id=ingredient,
+                amount=rng.choice(AMOUNTS),
+            ))
+    Recipe.tags.through.objects.bulk_create(tag_links, batch_size=BATCH_SIZE)
+    RecipeIngredient.objects.bulk_create(
+        ingredient_links, batch_size=BATCH_SIZE,
+    )
+
+    relations = ((FavouriteRecipe, favourites_per_user, recipe_ids, 'recipe'),
+                 (ShoppingCart, carts_per_user, recipe_ids, 'recipe'),
+                 (Follow, follows_per_user, user_ids, 'author'))
+    for model, per_user, targets, field in relations:
+        model.objects.bulk_create([
+            model(user_id=user, **{f'{field}_id': target})
+            for user in user_ids
+            for target in rng.sample(targets, min(per_user, len(targets)))
+            if target != user or model is not Follow
+        ], batch_size=BATCH_SIZE)
+
+    for counter in COUNTERS:
+        recount(*counter)
+    recompute_scores()
+    rebuild_shopping_lists()
+    update_search_index()
+    return {'users': user_ids, 'recipes': recipe_ids, 'tags': tag_ids}
@@ -0,0 +1,200 @@
+"""Нагрузочный тест API по HTTP.
+
+Несколько потоков в течение заданного времени отправляют запросы
+по сценарию SCENARIO от имени пользователей из файла benchmarks.seed.
+Каждый поток работает от своего пользователя. Django не требуется,
+только стандартная библиотека.
+
+Пример с SQLite (для PostgreSQL - переменные DB_* из .env):
+
+export DB_ENGINE=django.db.backends.sqlite3 DB_NAME=/tmp/bench.sqlite3
+python manage.py migrate
+python -m benchmarks.seed --recipes 100000 --output seed.json
+# Несколько воркеров должны делить кеш, иначе каждый кеширует своё.
+export CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache \\
+    CACHE_LOCATION=/tmp/foodgram-cache
+DISABLE_THROTTLING=1 gunicorn foodgram.wsgi -w 4 -b 127.0.0.1:8000 &
+python -m benchmarks.load seed.json --concurrency 16 --duration 30 \\
+    --output load.json
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import time
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from benchmarks import write_results
+
+# Операция: (вес, название, [(метод, URL), ...], анонимно).
+SCENARIO = (
+    (25, 'recipes_list', [('GET', '/api/recipes/?page={page}')], False),
+    (10, 'recipes_list_anonymous', [('GET', '/api/recipes/')], True),
+    (20, 'recipe_detail', [('GET', '/api/recipes/{recipe}/')], False),
+    (10, 'recipes_filtered', [
+        ('GET', '/api/recipes/?tags={tag}&is_favorited=1'),
+    ], False),
+    (5, 'recipes_search', [('GET', '/api/recipes/?search=рецепт')], False),
+    (5, 'recipes_match', [
+        ('GET', '/api/recipes/match/?have={ingredients}'),
+    ], False),
+    (5, 'subscriptions', [
+        ('GET', '/api/users/subscriptions/?recipes_limit=3'),
+    ], False),
+    (5, 'download_shopping_cart', [
+        ('GET', '/api/recipes/download_shopping_cart/'),
+    ], False),
+    (10, 'favorite_toggle', [
+        ('POST', '/api/recipes/{recipe}/favorite/'),
+        ('DELETE', '/api/recipes/{recipe}/favorite/'),
+    ], False),
+    (5, 'ingredients_search', [('GET', '/api/ingredients/?name=сол')], True),
+)
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+class Worker:
+    """Поток нагрузки со своим соединением и пользователем."""
+
+    def __init__(self, base_url, client, fixture, seed):
+        url = urlsplit(base_url)
+        connection_class = (http.client.HTTPSConnection
+                            if url.scheme == 'https'
+                            else http.client.HTTPConnection)
+        self.connection = connection_class(url.netloc, timeout=30)
+        self.prefix = url.path.rstrip('/')
+        self.token = client['token']
+        self.fixture = fixture
+        self.rng = random.Random(seed)
+        self.timings = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def context(self):
+        fixture = self.fixture
+        return {
+            'page': self.rng.randint(1, 20),
+            'recipe': self.rng.choice(fixture['recipes']),
+            'tag': self.rng.choice(fixture['tags']),
+            'ingredients': ','.join(map(str, self.rng.sample(
+                fixture['ingredients'], min(3, len(fixture['ingredients']))
+            ))),
+        }
+
+    def request(self, method, url, anonymous):
+        headers = {} if anonymous else {
+            'Authorization': f'Token {self.token}',
+        }
+        try:
+            self.connection.request(
+                method, quote(self.prefix + url, safe='/?=&,'),
+                headers=headers,
+            )
+            response = self.connection.getresponse()
+            response.read()
+            if response.will_close:
+                self.connection.close()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return 'error'
+
+    def run(self, deadline):
+        weights = [operation[0] for operation in SCENARIO]
+        while time.monotonic() < deadline:
+            _, name, requests, anonymous = self.rng.choices(
+                SCENARIO, weights,
+            )[0]
+            context = self.context()
+            started = time.perf_counter()
+            for method, url in requests:
+                status = self.request(method, url.format(**context), anonymous)
+                self.statuses[name][str(status)] += 1
+            self.timings[name].append(
+                (time.perf_counter() - started) * 1000
+            )
+        return self
+
+
+def summarize(workers, duration):
+    timings = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    for worker in workers:
+        for name, values in worker.timings.items():
+            timings[name].extend(values)
+        for name, counts in worker.statuses.items():
+            for status, count in counts.items():
+                statuses[name][status] += count
+    results = {}
+    for name, values in sorted(timings.items()):
+        values.sort()
+        errors = sum(
+            count for status, count in statuses[name].items()
+            if status == 'error' or status.startswith('5')
+        )
+        results[name] = {
+            'operations': len(values),
+            'errors': errors,
+            'statuses': dict(statuses[name]),
+            'p50_ms': round(statistics.median(values), 2),
+            'p95_ms': round(percentile(values, 0.95), 2),
+            'p99_ms': round(percentile(values, 0.99), 2),
+            'max_ms': round(values[-1], 2),
+        }
+    total = sum(result['operations'] for result in results.values())
+    results['total'] = {
+        'operations': total,
+        'errors': sum(result['errors'] for result in results.values()),
+        'operations_per_second': round(total / duration, 1),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument('fixture', help='JSON из benchmarks.seed.')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл для результатов в JSON.')
+    options = parser.parse_args()
+    with open(options.fixture, encoding='utf-8') as file:
+        fixture = json.load(file)
+    clients = fixture['clients']
+    if len(clients) < options.concurrency:
+        parser.error(f'В {options.fixture} только {len(clients)} '
+                     f'пользователей, нужно --clients {options.concurrency}')
+    workers = [
+        Worker(options.url, clients[number], fixture, options.seed + number)
+        for number in range(options.concurrency)
+    ]
+    deadline = time.monotonic() + options.duration
+    started = time.monotonic()
+    with ThreadPoolExecutor(options.concurrency) as executor:
+        list(executor.map(lambda worker: worker.run(deadline), workers))
+    results = summarize(workers, time.monotonic() - started)
+    for name, result in results.items():
+        if name == 'total':
+            continue
+        print('{:<24} {operations:>7} {errors:>6} {p50_ms:>9.2f} '
+              '{p95_ms:>9.2f} {p99_ms:>9.2f}'.format(name, **result))
+    print('Всего: {operations} операций, {errors} ошибок, '
+          '{operations_per_second}/с'.format(**results['total']))
+    if options.output:
+        write_results(
+            options.output, 'load', results, options,
+            database=fixture['database'],
+        )
+
+
+if __name__ == '__main__':
+    main()
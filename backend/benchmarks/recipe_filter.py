@@ -0,0 +1,82 @@
+"""План и время фильтрации рецептов.
+
+Перебирает сочетания 1-5 тэгов, фильтра по избранному и по автору.
+Данные генерируются внутри транзакции, которая откатывается в конце.
+
+python -m benchmarks.recipe_filter --recipes 100000 [--explain]
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup
+
+
+def measure(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset[:6])
+        queryset.count()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(options):
+    from django.db import transaction
+    from django.http import QueryDict
+    from django.test import RequestFactory
+
+    from api.filters import RecipeFilter
+    from benchmarks.data import generate
+    from recipes.models import Recipe, Tag
+    from users.models import CustomUser
+
+    with transaction.atomic():
+        started = time.perf_counter()
+        data = generate(
+            users=options.users, recipes=options.recipes, tags=8,
+            tags_per_recipe=3, favourites_per_user=options.favourites,
+        )
+        print(f'Данные: {options.recipes} рецептов за '
+              f'{time.perf_counter() - started:.1f} с')
+        request = RequestFactory().get('/api/recipes/')
+        request.user = CustomUser.objects.get(pk=data['users'][0])
+        slugs = list(Tag.objects.filter(pk__in=data['tags'])
+                     .values_list('slug', flat=True))
+        for tags in range(1, 6):
+            for favourites in (False, True):
+                for author in (False, True):
+                    params = QueryDict(mutable=True)
+                    params.setlist('tags', slugs[:tags])
+                    if favourites:
+                        params['is_favorited'] = '1'
+                    if author:
+                        params['author'] = str(data['users'][1])
+                    filterset = RecipeFilter(
+                        params, queryset=Recipe.objects.all(),
+                        request=request,
+                    )
+                    queryset = filterset.qs
+                    timing = measure(queryset, options.repeat)
+                    print(f'tags={tags} favourites={favourites:d} '
+                          f'author={author:d}: {timing:.2f} мс')
+                    if options.explain:
+                        print(queryset[:6].explain())
+        transaction.set_rollback(True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--favourites', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--explain', action='store_true')
+    options = parser.parse_args()
+    setup()
+    run(options)
+
+
+if __name__ == '__main__':
+    main()
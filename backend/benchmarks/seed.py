@@ -0,0 +1,73 @@
+"""Данные для нагрузочного теста.
+
+Заполняет БД (без отката) и сохраняет токены пользователей и id
+объектов в JSON, который читает benchmarks.load.
+
+python -m benchmarks.seed --recipes 100000 --output seed.json
+"""
+import argparse
+import json
+
+from benchmarks import setup
+
+
+def run(options):
+    from django.db import connection, transaction
+    from rest_framework.authtoken.models import Token
+
+    from benchmarks.data import generate
+    from recipes.models import RecipeIngredient, Tag
+
+    with transaction.atomic():
+        data = generate(
+            users=options.users, recipes=options.recipes,
+            favourites_per_user=options.favourites,
+            carts_per_user=options.carts, follows_per_user=options.follows,
+            seed=options.seed,
+        )
+        clients = data['users'][:options.clients]
+        Token.objects.bulk_create(
+            [Token(key=Token.generate_key(), user_id=user)
+             for user in clients],
+            ignore_conflicts=True,
+        )
+    tokens = dict(Token.objects.filter(user__in=clients).values_list(
+        'user', 'key'
+    ))
+    return {
+        'database': connection.vendor,
+        'clients': [
+            {'user': user, 'token': tokens[user]} for user in clients
+        ],
+        'users': data['users'][:1000],
+        'recipes': data['recipes'][:1000],
+        'tags': list(Tag.objects.filter(pk__in=data['tags']).values_list(
+            'slug', flat=True
+        )),
+        'ingredients': list(RecipeIngredient.objects.filter(
+            recipe__in=data['recipes'][:100],
+        ).values_list('ingredient', flat=True).distinct()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--favourites', type=int, default=50)
+    parser.add_argument('--carts', type=int, default=5)
+    parser.add_argument('--follows', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=64,
+                        help='Сколько пользователей получат токены.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='seed.json')
+    options = parser.parse_args()
+    setup()
+    fixture = run(options)
+    with open(options.output, 'w', encoding='utf-8') as file:
+        json.dump(fixture, file, ensure_ascii=False)
+    print(f'Сохранено: {options.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +72,15 @@ DATABASES = {
     }
 }
 
+# Кеш процесса по умолчанию подходит только для одного процесса: при
+# нескольких воркерах нужен общий кеш (memcached, файловый), см. README.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -94,7 +104,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_FILTER_BACKENDS': [
@@ -102,7 +112,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_PAGINATION_CLASS':
-        'rest_framework.pagination.PageNumberPagination',
+        'api.pagination.PageLimitPagination',
     'PAGE_SIZE': 6,
 
     'DEFAULT_THROTTLE_CLASSES': [
@@ -117,6 +127,20 @@ REST_FRAMEWORK = {
     }
 }
 
+# Для нагрузочного тестирования.
+if os.getenv('DISABLE_THROTTLING'):
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = []
+
+# Кеш токенов: число записей в процессе, время жизни в секундах
+# и хранение в общем кеше (CACHE_BACKEND) вместо кеша процесса
+# для нескольких процессов.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+TOKEN_CACHE_SHARED = bool(os.getenv('TOKEN_CACHE_SHARED'))
+
+# Ответы дольше этого времени пишутся в журнал с формами SQL-запросов.
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', default=500))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'USER_ID_FIELD': 'id',
@@ -1,8 +1,10 @@
 from django.contrib import admin
 
+from .images import schedule_variants
 from .models import (
-    AmountOfIngredient, FavouriteRecipe, Ingredient, Recipe, ShoppingCart, Tag,
+    FavouriteRecipe, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag,
 )
+from .shopping import change_cart_totals
 
 
 @admin.register(Ingredient)
@@ -13,11 +15,11 @@ class IngredientAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-@admin.register(AmountOfIngredient)
-class AmountOfIngredientAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'ingredient_recipe', 'amount', )
-    search_fields = ('ingredient_recipe', )
-    autocomplete_fields = ('ingredient_recipe', )
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    autocomplete_fields = ('ingredient', )
+    min_num = 1
+    extra = 0
 
 
 @admin.register(Tag)
@@ -34,13 +36,32 @@ class RecipeAdmin(admin.ModelAdmin):
         'pk', 'pub_date', 'author', 'name', 'text', 'cooking_time',
     )
     readonly_fields = ('favourites', )
-    autocomplete_fields = ('ingredients', 'tags', 'author')
+    exclude = (
+        'favorites_count', 'in_carts_count', 'image_variants', 'popularity',
+        'trending',
+    )
+    autocomplete_fields = ('tags', 'author')
+    inlines = (RecipeIngredientInline, )
     list_filter = ('pub_date', 'cooking_time', )
     search_fields = ('author', 'name', 'text', )
     empty_value_display = '-пусто-'
 
     def favourites(self, obj):
-        return obj.favourite_recipe.count()
+        return obj.favorites_count
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.image_variants = {}
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_variants(obj)
+
+    def save_related(self, request, form, formsets, change):
+        # Ингредиенты сохраняются инлайном: списки покупок с рецептом
+        # пересчитываются по старому и новому составу.
+        change_cart_totals([form.instance.pk], -1)
+        super().save_related(request, form, formsets, change)
+        change_cart_totals([form.instance.pk], 1)
 
 
 @admin.register(FavouriteRecipe)
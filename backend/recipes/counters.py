@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavouriteRecipe, Recipe, ShoppingCart
+from users.models import Follow
+
+User = get_user_model()
+
+# Счётчик: (модель со счётчиком, поле счётчика, считаемая модель, FK на неё).
+COUNTERS = (
+    (Recipe, 'favorites_count', FavouriteRecipe, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счётчик field объекта pk на delta."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def actual_count(related, fk):
+    """Выражение с фактическим числом объектов related для OuterRef('pk')."""
+    return Coalesce(Subquery(
+        related.objects.filter(**{fk: OuterRef('pk')}).order_by()
+        .values(fk).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def recount(model, field, related, fk, batch_size=10000):
+    """Пересчитывает счётчик пачками по pk, возвращает число исправлений."""
+    expression = actual_count(related, fk)
+    repaired = 0
+    last_pk = model.objects.order_by('-pk').values_list('pk', flat=True)
+    last_pk = last_pk.first() or 0
+    for start in range(0, last_pk + 1, batch_size):
+        queryset = model.objects.filter(
+            pk__gte=start, pk__lt=start + batch_size,
+        ).exclude(**{field: expression})
+        repaired += queryset.update(**{field: expression})
+    return repaired
@@ -0,0 +1,91 @@
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Ширина вариантов изображения рецепта в пикселях.
+VARIANT_WIDTHS = {'preview': 320, 'card': 640, 'full': 1280}
+FORMATS = ('webp', 'jpeg') if features.check('webp') else ('jpeg', )
+VARIANTS_DIR = 'recipe_images/variants/'
+QUALITY = 80
+# Варианты загруженных изображений создаются в фоне, вне запроса.
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='variants')
+
+
+def flatten(image):
+    """RGB-копия изображения: прозрачность заливается белым."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(file, storage=default_storage):
+    """Сохраняет варианты изображения и возвращает их имена в хранилище.
+
+    Результат: {'preview': {'webp': имя, 'jpeg': имя}, ...}. Имена
+    содержат хеш исходного файла, поэтому повторная обработка того же
+    изображения не создаёт новых файлов. Метаданные (EXIF и т.п.)
+    в варианты не переносятся.
+    """
+    file.seek(0)
+    content = file.read()
+    digest = sha256(content).hexdigest()[:16]
+    with Image.open(BytesIO(content)) as source:
+        image = flatten(source)
+    variants = {}
+    for variant, width in VARIANT_WIDTHS.items():
+        resized = image
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+        variants[variant] = {}
+        for image_format in FORMATS:
+            name = f'{VARIANTS_DIR}{digest}-{variant}.{image_format}'
+            if not storage.exists(name):
+                buffer = BytesIO()
+                resized.save(buffer, image_format, quality=QUALITY)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            variants[variant][image_format] = name
+    return variants
+
+
+def update_variants(pk, name):
+    """Создаёт варианты изображения name и сохраняет их в рецепт pk.
+
+    Если изображение рецепта успели заменить, результат отбрасывается.
+    """
+    from recipes.models import Recipe
+
+    try:
+        with default_storage.open(name) as file:
+            variants = render_variants(file)
+        recipe = Recipe.objects.filter(pk=pk, image=name).first()
+        if recipe is not None:
+            recipe.image_variants = variants
+            recipe.save(update_fields=['image_variants', 'updated'])
+    except Exception:
+        logger.exception('Не удалось создать варианты изображения %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """Ставит создание вариантов в очередь после фиксации транзакции.
+
+    До их появления клиенты получают оригинал изображения, а варианты,
+    не созданные из-за перезапуска процесса, создаст process_images.
+    """
+    pk, name = recipe.pk, recipe.image.name
+    transaction.on_commit(lambda: executor.submit(update_variants, pk, name))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.transfer import export_recipes
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты в формате import_recipes: NDJSON '
+            'с изображениями в data URI или tar (.tar, .tar.gz) '
+            'с изображениями отдельными файлами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .ndjson, .jsonl или .tar.')
+        parser.add_argument(
+            '--author', help='Только рецепты автора с этим email.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['author']:
+            recipes = recipes.filter(author__email=options['author'])
+        with open(options['path'], 'wb') as file:
+            exported, missing = export_recipes(
+                recipes, file, options['path'],
+            )
+        for pk in missing:
+            self.stderr.write(f'Рецепт {pk}: нет файла изображения')
+        self.stdout.write(f'Выгружено рецептов: {exported}')
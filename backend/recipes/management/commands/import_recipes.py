@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.transfer import BATCH_SIZE, RecipeSource, import_recipes
+
+User = get_user_model()
+
+
+def format_errors(errors):
+    return '; '.join(f'{field}: {message}'
+                     for field, message in errors.items())
+
+
+class Command(BaseCommand):
+    help = ('Импортирует рецепты из NDJSON или tar (recipes.ndjson '
+            'и изображения). Ошибочные строки пропускаются и выводятся '
+            'с номерами. Варианты изображений затем создаёт process_images.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .ndjson, .jsonl или .tar.')
+        parser.add_argument(
+            '--author', required=True, help='Email автора рецептов.',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(email=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {options["author"]}')
+        with open(options['path'], 'rb') as file:
+            try:
+                source = RecipeSource(file, options['path'])
+            except ValueError as error:
+                raise CommandError(error)
+            created, errors = import_recipes(
+                source, author, options['batch_size'],
+            )
+        for number, line_errors in errors:
+            self.stderr.write(f'Строка {number}: {format_errors(line_errors)}')
+        self.stdout.write(f'Создано рецептов: {created}, '
+                          f'строк с ошибками: {len(errors)}')
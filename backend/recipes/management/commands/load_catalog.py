@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import Ingredient, Tag
+from recipes.signals import catalog_loaded
+
+# Справочник: (модель, поля в порядке столбцов CSV, поля ключа).
+CATALOGS = {
+    'ingredients': (
+        Ingredient, ('name', 'measurement_unit'), ('name', 'measurement_unit'),
+    ),
+    'tags': (Tag, ('name', 'color', 'slug'), ('slug', )),
+}
+
+
+def normalize(value):
+    return ' '.join(str(value).split())
+
+
+def read_rows(path, fields):
+    """Построчно читает CSV, JSON или NDJSON (.jsonl, .ndjson)."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8') as file:
+        if extension == '.csv':
+            for row in csv.reader(file):
+                yield dict(zip(fields, row))
+        elif extension in ('.jsonl', '.ndjson'):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.json':
+            yield from json.load(file)
+        else:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+
+
+class Command(BaseCommand):
+    help = ('Загружает справочник ингредиентов или тэгов из CSV/JSON. '
+            'Повторный запуск безопасен: существующие записи пропускаются '
+            'или обновляются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV, JSON или NDJSON.')
+        parser.add_argument(
+            '--catalog', choices=CATALOGS, default='ingredients',
+            help='Справочник: ingredients (по умолчанию) или tags.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        model, fields, _ = CATALOGS[options['catalog']]
+        self.stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        rows = read_rows(options['path'], fields)
+        load = getattr(self, f'load_{options["catalog"]}')
+        while True:
+            batch = list(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic():
+                load(batch)
+        catalog_loaded.send(sender=model)
+        self.stdout.write(
+            'Добавлено: {inserted}, обновлено: {updated}, '
+            'пропущено: {skipped}'.format(**self.stats)
+        )
+
+    def clean(self, batch, catalog):
+        """Нормализует строки пачки и отбрасывает неполные и повторы."""
+        _, fields, key_fields = CATALOGS[catalog]
+        cleaned = {}
+        for row in batch:
+            values = {field: normalize(row.get(field) or '')
+                      for field in fields}
+            if not all(values.values()):
+                self.stats['skipped'] += 1
+                continue
+            key = tuple(values[field] for field in key_fields)
+            if key in cleaned:
+                self.stats['skipped'] += 1
+            cleaned[key] = values
+        return cleaned
+
+    def load_ingredients(self, batch):
+        cleaned = self.clean(batch, 'ingredients')
+        names = {name for name, _ in cleaned}
+        existing = set(Ingredient.objects.filter(name__in=names).values_list(
+            'name', 'measurement_unit'
+        ))
+        new = [Ingredient(**values) for key, values in cleaned.items()
+               if key not in existing]
+        Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+        self.stats['inserted'] += len(new)
+        self.stats['skipped'] += len(cleaned) - len(new)
+
+    def load_tags(self, batch):
+        cleaned = {
+            slug: values for (slug, ), values in self.clean(
+                batch, 'tags'
+            ).items()
+        }
+        existing = Tag.objects.in_bulk(cleaned, field_name='slug')
+        changed = []
+        for slug, tag in existing.items():
+            values = cleaned[slug]
+            if (tag.name, tag.color) == (values['name'], values['color']):
+                self.stats['skipped'] += 1
+                continue
+            tag.name, tag.color = values['name'], values['color']
+            changed.append(tag)
+        Tag.objects.bulk_update(changed, ['name', 'color'])
+        new = [Tag(**values) for slug, values in cleaned.items()
+               if slug not in existing]
+        Tag.objects.bulk_create(new, ignore_conflicts=True)
+        self.stats['updated'] += len(changed)
+        self.stats['inserted'] += len(new)
@@ -0,0 +1,60 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from recipes.images import render_variants
+from recipes.models import Recipe
+
+
+def process(task):
+    pk, name = task
+    try:
+        with default_storage.open(name) as file:
+            return pk, render_variants(file), None
+    except Exception as error:
+        return pk, None, error
+
+
+class Command(BaseCommand):
+    help = ('Создаёт варианты изображений для рецептов, у которых их ещё '
+            'нет (или для всех с ключом --all).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Обработать все рецепты, а не только без вариантов.',
+        )
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        tasks = list(recipes.values_list('pk', 'image'))
+        connections.close_all()
+        processed, failed, batch = 0, 0, []
+        with ProcessPoolExecutor(options['workers']) as executor:
+            for pk, variants, error in executor.map(process, tasks,
+                                                    chunksize=16):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'Рецепт {pk}: {error}')
+                    continue
+                # Новое время изменения сбрасывает кеш рецепта в API.
+                batch.append(Recipe(pk=pk, image_variants=variants,
+                                    updated=timezone.now()))
+                if len(batch) >= options['batch_size']:
+                    processed += self.save(batch)
+        processed += self.save(batch)
+        self.stdout.write(f'Обработано: {processed}, ошибок: {failed}')
+
+    @staticmethod
+    def save(batch):
+        Recipe.objects.bulk_update(batch, ['image_variants', 'updated'])
+        saved = len(batch)
+        batch.clear()
+        return saved
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.shopping import mismatched_users, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = ('Сверяет материализованные списки покупок с корзинами '
+            'и пересобирает расходящиеся.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить; при расхождениях код возврата 1.',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересобрать списки всех пользователей без сверки.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            rebuild_shopping_lists()
+            self.stdout.write('Списки покупок пересобраны.')
+            return
+        users = mismatched_users()
+        if options['check']:
+            if users:
+                raise CommandError(
+                    f'Списки покупок расходятся с корзинами у '
+                    f'{len(users)} пользователей: {users[:20]}'
+                )
+            self.stdout.write('Списки покупок согласованы.')
+            return
+        rebuild_shopping_lists(users)
+        self.stdout.write(f'Исправлено списков покупок: {len(users)}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.scores import recompute_scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает популярность и тренд рецептов. Запускается '
+            'периодически (например, раз в час), чтобы тренды затухали.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Количество рецептов, обновляемых одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        updated = recompute_scores(options['batch_size'])
+        self.stdout.write(f'Обновлено рецептов: {updated}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики рецептов и авторов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Количество строк, обновляемых одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related, fk in COUNTERS:
+            repaired = recount(
+                model, field, related, fk, options['batch_size'],
+            )
+            self.stdout.write(
+                f'{model._meta.label}.{field}: исправлено {repaired}'
+            )
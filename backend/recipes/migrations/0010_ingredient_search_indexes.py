@@ -0,0 +1,36 @@
+from django.db import migrations
+
+INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_lower_name '
+    'ON recipes_ingredient (lower(name) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (lower(name) gin_trgm_ops)',
+)
+
+DROP_INDEXES = (
+    'DROP INDEX IF EXISTS recipes_ingredient_lower_name',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+)
+
+
+def run_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_shopping_cart_added_recipe_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_postgresql(INDEXES), run_postgresql(DROP_INDEXES),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    counters = (
+        ('recipes.Recipe', 'favorites_count', 'recipes.FavouriteRecipe',
+         'recipe'),
+        ('recipes.Recipe', 'in_carts_count', 'recipes.ShoppingCart',
+         'recipe'),
+        ('users.CustomUser', 'recipes_count', 'recipes.Recipe', 'author'),
+        ('users.CustomUser', 'followers_count', 'users.Follow', 'author'),
+    )
+    for model, field, related, fk in counters:
+        related = apps.get_model(related)
+        apps.get_model(model).objects.update(**{field: Coalesce(Subquery(
+            related.objects.filter(**{fk: OuterRef('pk')}).order_by()
+            .values(fk).annotate(total=Count('pk')).values('total')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_ingredient_search_indexes'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_unique_ingredient_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, help_text='Уменьшенные копии изображения по размерам и форматам', verbose_name='Варианты изображения'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+INGREDIENT_NAMES = """
+    SELECT {aggregate}
+    FROM recipes_recipe_ingredients AS link
+    JOIN recipes_amountofingredient AS amount
+        ON amount.id = link.amountofingredient_id
+    JOIN recipes_ingredient AS ingredient
+        ON ingredient.id = amount.ingredient_recipe_id
+    WHERE link.recipe_id = recipe.id
+"""
+
+POSTGRESQL = (
+    'CREATE INDEX recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+    """
+    UPDATE recipes_recipe AS recipe SET search_vector =
+        setweight(to_tsvector('russian', recipe.name), 'A')
+        || setweight(to_tsvector('russian', coalesce(({}), '')), 'B')
+        || setweight(to_tsvector('russian', recipe.text), 'C')
+    """.format(INGREDIENT_NAMES.format(
+        aggregate="string_agg(ingredient.name, ' ')"
+    )),
+)
+
+SQLITE = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts '
+    'USING fts5(name, ingredients, text)',
+    """
+    INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text)
+    SELECT recipe.id, recipe.name, coalesce(({}), ''), recipe.text
+    FROM recipes_recipe AS recipe
+    """.format(INGREDIENT_NAMES.format(
+        aggregate="group_concat(ingredient.name, ' ')"
+    )),
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRESQL, 'sqlite': SQLITE}.get(vendor, ())
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True,
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
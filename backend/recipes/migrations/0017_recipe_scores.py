@@ -0,0 +1,52 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+POPULARITY = """
+    UPDATE recipes_recipe SET popularity =
+        3.0 * favorites_count + 2.0 * in_carts_count + 0.5 * coalesce((
+            SELECT followers_count FROM users_customuser
+            WHERE users_customuser.id = recipes_recipe.author_id
+        ), 0)
+"""
+TRENDING = 'UPDATE recipes_recipe SET trending = popularity / POWER({} + 2, 1.5)'
+AGE = {
+    'postgresql': 'CAST((CURRENT_DATE - pub_date) AS FLOAT)',
+    'sqlite': "(julianday('now') - julianday(pub_date))",
+}
+
+
+def fill_scores(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    schema_editor.execute(POPULARITY)
+    schema_editor.execute(TRENDING.format(AGE.get(vendor, AGE['postgresql'])))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_search_vector'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending',
+            field=models.FloatField(default=0, verbose_name='Тренд'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending', '-id'], name='recipe_trending_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
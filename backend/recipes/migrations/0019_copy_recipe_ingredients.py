@@ -0,0 +1,45 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 10000
+
+# Повторяющиеся в рецепте ингредиенты складываются.
+COPY = """
+    INSERT INTO recipes_recipeingredient (recipe_id, ingredient_id, amount)
+    SELECT link.recipe_id, amount.ingredient_recipe_id, SUM(amount.amount)
+    FROM recipes_recipe_ingredients AS link
+    JOIN recipes_amountofingredient AS amount
+        ON amount.id = link.amountofingredient_id
+    WHERE link.recipe_id >= %s AND link.recipe_id < %s
+    GROUP BY link.recipe_id, amount.ingredient_recipe_id
+    ON CONFLICT DO NOTHING
+"""
+
+
+def copy_ingredients(apps, schema_editor):
+    """Копирует ингредиенты пачками рецептов, каждая в своей транзакции.
+
+    Старые таблицы только читаются, а блокировки новой таблицы держатся
+    не дольше одной пачки. Повторный запуск после сбоя пропускает
+    уже скопированные строки.
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(recipe_id) FROM recipes_recipe_ingredients')
+        last = cursor.fetchone()[0] or 0
+    for start in range(0, last + 1, BATCH_SIZE):
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(COPY, [start, start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0018_recipeingredient'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_ingredients),
+    ]
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -20,32 +21,15 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
-
-    def __str__(self):
-        return self.name
-
-
-class AmountOfIngredient(models.Model):
-    """Количество ингредиентов."""
-
-    ingredient_recipe = models.ForeignKey(
-        Ingredient, on_delete=models.CASCADE,
-        verbose_name='Ингредиент', help_text='Выберите ингредиент',
-    )
-    amount = models.PositiveSmallIntegerField(
-        'Количество', blank=False, default=1,
-        validators=[
-            MinValueValidator(1, 'Минимальное количество ингредиента')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            )
         ]
-    )
-
-    class Meta:
-        verbose_name = 'Количество ингредиента'
-        verbose_name_plural = 'Количество ингредиентов'
 
     def __str__(self):
-        return (f'{self.amount} {self.ingredient_recipe.measurement_unit} '
-                f'{self.ingredient_recipe.name}')
+        return self.name
 
 
 class Tag(models.Model):
@@ -82,12 +66,17 @@ class Recipe(models.Model):
     name = models.CharField('Название рецепта', max_length=200, blank=False,)
     text = models.TextField('Описание рецепта', blank=False,)
     ingredients = models.ManyToManyField(
-        AmountOfIngredient, blank=False, related_name='recipes',
+        Ingredient, through='RecipeIngredient', blank=False,
+        related_name='recipes',
         verbose_name='Ингредиенты',
     )
     image = models.ImageField(
         'Изображение рецепта', upload_to='recipe_images/', blank=False,
     )
+    image_variants = models.JSONField(
+        'Варианты изображения', default=dict, blank=True,
+        help_text='Уменьшенные копии изображения по размерам и форматам',
+    )
     tags = models.ManyToManyField(Tag, blank=False, related_name='recipes')
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления', blank=False, default=10,
@@ -99,9 +88,30 @@ class Recipe(models.Model):
     pub_date = models.DateField(
         'Дата публикации', auto_now_add=True, db_index=True, blank=False,
     )
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, db_index=True,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0,
+    )
+    popularity = models.FloatField('Популярность', default=0)
+    trending = models.FloatField('Тренд', default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['-popularity', '-id'], name='recipe_popularity_idx',
+            ),
+            models.Index(
+                fields=['-trending', '-id'], name='recipe_trending_idx',
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -109,6 +119,49 @@ class Recipe(models.Model):
         return self.name
 
 
+class RecipeIngredient(models.Model):
+    """Ингредиент рецепта с количеством."""
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='recipe_ingredients',
+        verbose_name='Рецепт', db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='recipe_ingredients', verbose_name='Ингредиент',
+        help_text='Выберите ингредиент', db_index=False,
+    )
+    amount = models.PositiveSmallIntegerField(
+        'Количество', blank=False, default=1,
+        validators=[
+            MinValueValidator(1, 'Минимальное количество ингредиента')
+        ]
+    )
+
+    class Meta:
+        # Уникальный индекс (recipe, ingredient) обслуживает чтение
+        # ингредиентов рецепта, (ingredient, recipe) - поиск рецептов
+        # по ингредиентам без обращения к таблице.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='recipe_ingredient_reverse_idx',
+            ),
+        ]
+        verbose_name = 'Ингредиент рецепта'
+        verbose_name_plural = 'Ингредиенты рецепта'
+
+    def __str__(self):
+        return (f'{self.amount} {self.ingredient.measurement_unit} '
+                f'{self.ingredient.name}')
+
+
 class FavouriteRecipe(models.Model):
     """Список избранных рецептов у пользователя."""
 
@@ -147,6 +200,7 @@ class ShoppingCart(models.Model):
         Recipe, on_delete=models.CASCADE, related_name='shopcart',
         verbose_name='Рецепт',
     )
+    added = models.DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         verbose_name = 'Корзина'
@@ -161,3 +215,37 @@ class ShoppingCart(models.Model):
     def __str__(self) -> str:
         return (f'Пользователь {self.user.username} добавил рецепт: '
                 f'{self.recipe.name} в список покупок')
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по рецептам из корзины пользователя.
+
+    Обновляется при изменении корзины и ингредиентов рецептов
+    (recipes.shopping), сверяется и исправляется командой
+    rebuild_shopping_lists.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list',
+        verbose_name='Пользователь', db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items', verbose_name='Ингредиент',
+    )
+    total_amount = models.IntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        # Уникальный индекс (user, ingredient) обслуживает и чтение
+        # списка пользователя.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.ingredient}: {self.total_amount}'
@@ -0,0 +1,112 @@
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Связи user -> targets добавлены (added=True) или удалены одним вызовом
+# add_relations/remove_relations (sender - модель связи). Их post_save
+# и post_delete отправляются с batched=True: обработчики, которым хватает
+# одного relations_changed на вызов, такие сигналы пропускают.
+relations_changed = Signal()
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def send_signals(model, signal, rows, user, field, **kwargs):
+    """Объекты связей по строкам RETURNING с отправкой сигнала signal.
+
+    Сигналы отправляются так же, как при save() и delete(), поэтому
+    счётчики, оценки и кеши обновляются обработчиками как обычно.
+    """
+    objects = []
+    for pk, target in rows:
+        obj = model(pk=pk, user=user, **{f'{field}_id': target})
+        signal.send(
+            sender=model, instance=obj, using=connection.alias,
+            batched=True, **kwargs,
+        )
+        objects.append(obj)
+    return objects
+
+
+def send_batch_signal(model, user, rows, added):
+    if rows:
+        relations_changed.send(
+            sender=model, user=user, targets=[target for _, target in rows],
+            added=added,
+        )
+
+
+@transaction.atomic
+def add_relations(model, user, field, targets):
+    """Создаёт связи user -> targets (избранное, корзина, подписки).
+
+    Одна команда INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING:
+    несуществующие цели отсекаются выборкой из их таблицы, а уже
+    существующие связи - уникальным ограничением, без предварительных
+    проверок и без IntegrityError при одновременных запросах.
+    Возвращает созданные связи. Требует RETURNING (PostgreSQL,
+    SQLite 3.35+).
+    """
+    targets = list(targets)
+    if not targets:
+        return []
+    quote = connection.ops.quote_name
+    meta = model._meta
+    fk = meta.get_field(field)
+    target_meta = fk.related_model._meta
+    columns = [meta.get_field('user').column, fk.column]
+    values = ['%s', quote(target_meta.pk.column)]
+    params = [user.pk]
+    for model_field in meta.concrete_fields:
+        if getattr(model_field, 'auto_now_add', False):
+            columns.append(model_field.column)
+            values.append('%s')
+            params.append(connection.ops.adapt_datetimefield_value(
+                timezone.now()
+            ))
+    sql = (
+        f'INSERT INTO {quote(meta.db_table)} '
+        f'({", ".join(quote(column) for column in columns)}) '
+        f'SELECT {", ".join(values)} FROM {quote(target_meta.db_table)} '
+        f'WHERE {quote(target_meta.pk.column)} IN ({placeholders(targets)}) '
+        f'ON CONFLICT DO NOTHING '
+        f'RETURNING {quote(meta.pk.column)}, {quote(fk.column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + targets)
+        rows = cursor.fetchall()
+    objects = send_signals(
+        model, post_save, rows, user, field,
+        created=True, update_fields=None, raw=False,
+    )
+    send_batch_signal(model, user, rows, added=True)
+    return objects
+
+
+@transaction.atomic
+def remove_relations(model, user, field, targets):
+    """Удаляет связи user -> targets одной командой DELETE ... RETURNING.
+
+    Возвращает удалённые связи.
+    """
+    targets = list(targets)
+    if not targets:
+        return []
+    quote = connection.ops.quote_name
+    meta = model._meta
+    fk = meta.get_field(field)
+    sql = (
+        f'DELETE FROM {quote(meta.db_table)} '
+        f'WHERE {quote(meta.get_field("user").column)} = %s '
+        f'AND {quote(fk.column)} IN ({placeholders(targets)}) '
+        f'RETURNING {quote(meta.pk.column)}, {quote(fk.column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk] + targets)
+        rows = cursor.fetchall()
+    objects = send_signals(model, post_delete, rows, user, field)
+    send_batch_signal(model, user, rows, added=False)
+    return objects
@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F, FloatField, Func, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Power
+
+from recipes.models import FavouriteRecipe, Recipe, ShoppingCart
+from users.models import Follow
+
+User = get_user_model()
+
+FAVOURITE_WEIGHT = 3.0
+CART_WEIGHT = 2.0
+SUBSCRIBER_WEIGHT = 0.5
+# Чем больше, тем быстрее старые рецепты уходят из трендов.
+GRAVITY = 1.5
+
+# Событие: (поле рецепта для фильтра, FK события, вес).
+SCORE_EVENTS = {
+    FavouriteRecipe: ('pk', 'recipe_id', FAVOURITE_WEIGHT),
+    ShoppingCart: ('pk', 'recipe_id', CART_WEIGHT),
+    Follow: ('author', 'author_id', SUBSCRIBER_WEIGHT),
+}
+
+ORDERINGS = {
+    'popular': ('-popularity', '-id'),
+    'trending': ('-trending', '-id'),
+}
+
+
+class AgeInDays(Func):
+    """Возраст даты в днях относительно сегодняшнего дня."""
+
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST((CURRENT_DATE - %(expressions)s) AS FLOAT)',
+            **extra_context,
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template="(julianday('now') - julianday(%(expressions)s))",
+            **extra_context,
+        )
+
+
+def trending(popularity):
+    """Популярность, затухающая с возрастом рецепта."""
+    return popularity / Power(
+        AgeInDays('pub_date') + Value(2.0), Value(GRAVITY),
+    )
+
+
+def popularity():
+    """Популярность по счётчикам рецепта и подписчикам автора."""
+    followers = Subquery(
+        User.objects.filter(pk=OuterRef('author')).values('followers_count')
+    )
+    return (
+        F('favorites_count') * FAVOURITE_WEIGHT
+        + F('in_carts_count') * CART_WEIGHT
+        + Coalesce(followers, 0) * SUBSCRIBER_WEIGHT
+    )
+
+
+def change_score(event, delta):
+    """Учитывает событие (избранное, корзина, подписка) в оценках рецептов.
+
+    Популярность меняется на вес события, тренд пересчитывается из новой
+    популярности с текущим затуханием - одним UPDATE без чтения.
+    """
+    field, fk, weight = SCORE_EVENTS[type(event)]
+    points = Value(weight * delta)
+    Recipe.objects.filter(**{field: getattr(event, fk)}).update(
+        popularity=F('popularity') + points,
+        trending=trending(F('popularity') + points),
+    )
+
+
+def recompute_scores(batch_size=10000):
+    """Пересчитывает оценки всех рецептов пачками по pk."""
+    last_pk = Recipe.objects.order_by('-pk').values_list('pk', flat=True)
+    last_pk = last_pk.first() or 0
+    updated = 0
+    for start in range(0, last_pk + 1, batch_size):
+        updated += Recipe.objects.filter(
+            pk__gte=start, pk__lt=start + batch_size,
+        ).update(popularity=popularity(), trending=trending(popularity()))
+    return updated
@@ -0,0 +1,230 @@
+import re
+import time
+
+from bisect import bisect_left
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast, Lower
+
+from recipes.models import Ingredient, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Названия ингредиентов рецепта через пробел.
+INGREDIENT_NAMES = """
+    SELECT {aggregate}
+    FROM recipes_recipeingredient AS link
+    JOIN recipes_ingredient AS ingredient ON ingredient.id = link.ingredient_id
+    WHERE link.recipe_id = recipe.id
+"""
+UPDATE_SEARCH_VECTOR = """
+    UPDATE recipes_recipe AS recipe SET search_vector =
+        setweight(to_tsvector('{config}', recipe.name), 'A')
+        || setweight(to_tsvector('{config}', coalesce(({names}), '')), 'B')
+        || setweight(to_tsvector('{config}', recipe.text), 'C')
+""".format(
+    config=SEARCH_CONFIG,
+    names=INGREDIENT_NAMES.format(
+        aggregate="string_agg(ingredient.name, ' ')",
+    ),
+)
+INSERT_FTS = """
+    INSERT INTO {table} (rowid, name, ingredients, text)
+    SELECT recipe.id, recipe.name, coalesce(({names}), ''), recipe.text
+    FROM recipes_recipe AS recipe
+""".format(
+    table=FTS_TABLE,
+    names=INGREDIENT_NAMES.format(
+        aggregate="group_concat(ingredient.name, ' ')",
+    ),
+)
+# Веса столбцов name, ingredients, text в bm25 (аналог весов A, B, C).
+FTS_RANK = f'-bm25({FTS_TABLE}, 10.0, 4.0, 1.0)'
+# Версия индекса ингредиентов в общем кеше: её меняет процесс, изменивший
+# ингредиенты (в том числе load_catalog), остальные перечитывают индекс.
+INDEX_VERSION_KEY = 'ingredient-index:version'
+# С кешем процесса чужая версия не видна: индекс перечитывается и по
+# истечении этого времени, как справочники в api.cache.
+INDEX_TIMEOUT = 60 * 5
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Названия хранятся отсортированными в нижнем регистре: совпадения
+    по началу находятся бинарным поиском, вхождения - одним проходом
+    по списку. Используется для SQLite, где нет триграммных индексов.
+    Перечитывается при смене версии INDEX_VERSION_KEY (сигналы изменения
+    ингредиентов) и не реже, чем раз в INDEX_TIMEOUT секунд.
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._version = None
+        self._loaded = 0
+
+    def invalidate(self):
+        self._entries = None
+        cache.set(INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+
+    def _load(self):
+        version = cache.get(INDEX_VERSION_KEY)
+        entries = self._entries
+        if (entries is None or version != self._version
+                or time.monotonic() - self._loaded > INDEX_TIMEOUT):
+            rows = Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+            entries = sorted(
+                (name.lower(), pk, name, unit) for pk, name, unit in rows
+            )
+            entries = ([entry[0] for entry in entries], entries)
+            self._entries, self._version = entries, version
+            self._loaded = time.monotonic()
+        return entries
+
+    def search(self, term, limit=None):
+        keys, entries = self._load()
+        found = []
+        position = bisect_left(keys, term)
+        while (position < len(keys) and keys[position].startswith(term)
+               and len(found) != limit):
+            found.append(entries[position])
+            position += 1
+        if len(found) != limit:
+            for entry in entries:
+                if term in entry[0] and not entry[0].startswith(term):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return [
+            Ingredient(id=pk, name=name, measurement_unit=unit)
+            for _, pk, name, unit in found
+        ]
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_ingredients(queryset, term, limit=None):
+    """Ингредиенты, название которых содержит term.
+
+    Сначала идут совпадения по началу названия, затем остальные вхождения,
+    внутри каждой группы - по алфавиту. На PostgreSQL запросы используют
+    функциональный индекс по lower(name) и триграммный GIN-индекс,
+    на остальных СУБД поиск выполняется по индексу в памяти процесса.
+    """
+    term = term.lower()
+    if connection.vendor != 'postgresql':
+        return ingredient_index.search(term, limit)
+    queryset = queryset.annotate(lower_name=Lower('name'))
+    prefix = list(
+        queryset.filter(lower_name__startswith=term)
+        .order_by('lower_name')[:limit]
+    )
+    if len(prefix) == limit:
+        return prefix
+    rest = (
+        queryset.filter(lower_name__contains=term)
+        .exclude(lower_name__startswith=term)
+        .order_by('lower_name')
+    )
+    if limit is not None:
+        rest = rest[:limit - len(prefix)]
+    return prefix + list(rest)
+
+
+def update_search_index(pks=None):
+    """Пересчитывает поисковый индекс рецептов pks (по умолчанию всех).
+
+    На PostgreSQL это столбец search_vector, на SQLite - таблица FTS5.
+    Удалённые рецепты из таблицы FTS5 просто исчезают.
+    """
+    if pks is not None:
+        pks = list(pks)
+        if not pks:
+            return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if pks is None:
+                cursor.execute(UPDATE_SEARCH_VECTOR)
+            else:
+                cursor.execute(
+                    UPDATE_SEARCH_VECTOR + ' WHERE recipe.id = ANY(%s)',
+                    [pks],
+                )
+            return
+        if pks is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(INSERT_FTS)
+            return
+        placeholders = ', '.join(['%s'] * len(pks))
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', pks,
+        )
+        cursor.execute(
+            INSERT_FTS + f' WHERE recipe.id IN ({placeholders})', pks,
+        )
+
+
+def fts_query(term):
+    """Запрос FTS5: все слова term как префиксы, без операторов."""
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', term))
+
+
+def search_recipes(queryset, term):
+    """Рецепты по полнотекстовому запросу, от наиболее релевантных.
+
+    На PostgreSQL используется GIN-индекс по search_vector и ts_rank,
+    на SQLite - таблица FTS5 и bm25. Совпадение в названии весит больше,
+    чем в ингредиентах, а в ингредиентах - больше, чем в описании.
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            term, config=SEARCH_CONFIG, search_type='websearch',
+        )
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+        )
+    else:
+        match = fts_query(term)
+        if not match:
+            return queryset.none()
+        # Соединение с таблицей FTS5, а не подзапрос на каждую строку:
+        # bm25 вычисляется за один проход полнотекстового индекса.
+        queryset = queryset.extra(
+            select={'search_rank': FTS_RANK},
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+        )
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
+
+
+def match_recipes(queryset, ingredient_ids):
+    """Рецепты, в которых есть хотя бы один из ингредиентов ingredient_ids.
+
+    Каждый рецепт получает matched (сколько его ингредиентов есть),
+    missing (сколько не хватает) и coverage (доля имеющихся). Сначала
+    идут рецепты с наибольшим покрытием, затем с меньшим числом
+    недостающих. Кандидаты выбираются по индексу связей рецептов
+    с ингредиентами, а подсчёт выполняется одним сгруппированным запросом
+    только по ним, поэтому остальные рецепты не просматриваются.
+    """
+    have = Q(recipe_ingredients__ingredient__in=ingredient_ids)
+    candidates = RecipeIngredient.objects.filter(
+        ingredient__in=ingredient_ids,
+    ).values('recipe')
+    return queryset.filter(pk__in=candidates).annotate(
+        matched=Count('recipe_ingredients', filter=have),
+        total=Count('recipe_ingredients'),
+    ).annotate(
+        missing=F('total') - F('matched'),
+        coverage=Cast('matched', FloatField()) / F('total'),
+    ).order_by('-coverage', 'missing', '-pub_date', '-id')
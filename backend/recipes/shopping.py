@@ -0,0 +1,132 @@
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from recipes.models import ShoppingListItem
+from recipes.relations import placeholders
+from recipes.units import base_amount, base_unit
+
+# Суммы ингредиентов по корзинам, из которых строится ShoppingListItem.
+CART_TOTALS = """
+    SELECT cart.user_id, item.ingredient_id, SUM(item.amount)
+    FROM recipes_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS item ON item.recipe_id = cart.recipe_id
+    WHERE {where}
+    GROUP BY cart.user_id, item.ingredient_id
+"""
+# Вклад рецептов в корзину одного пользователя.
+RECIPE_TOTALS = """
+    SELECT %s, item.ingredient_id, {sign} SUM(item.amount)
+    FROM recipes_recipeingredient AS item
+    WHERE item.recipe_id IN ({recipes})
+    GROUP BY item.ingredient_id
+"""
+# Вклад рецептов во все корзины, где они есть.
+FAN_OUT_TOTALS = """
+    SELECT cart.user_id, item.ingredient_id, {sign} SUM(item.amount)
+    FROM recipes_shoppingcart AS cart
+    JOIN recipes_recipeingredient AS item ON item.recipe_id = cart.recipe_id
+    WHERE cart.recipe_id IN ({recipes})
+    GROUP BY cart.user_id, item.ingredient_id
+"""
+UPSERT = """
+    INSERT INTO recipes_shoppinglistitem (user_id, ingredient_id, total_amount)
+    {select}
+    ON CONFLICT (user_id, ingredient_id) DO UPDATE
+    SET total_amount = recipes_shoppinglistitem.total_amount
+        + excluded.total_amount
+"""
+DELETE_EMPTY = """
+    DELETE FROM recipes_shoppinglistitem
+    WHERE total_amount <= 0 AND user_id IN ({users})
+"""
+MISMATCHED_USERS = """
+    SELECT missing.user_id FROM (
+        {totals}
+        EXCEPT
+        SELECT user_id, ingredient_id, total_amount
+        FROM recipes_shoppinglistitem
+    ) AS missing
+    UNION
+    SELECT extra.user_id FROM (
+        SELECT user_id, ingredient_id, total_amount
+        FROM recipes_shoppinglistitem
+        EXCEPT
+        {totals}
+    ) AS extra
+"""
+
+
+def change_cart_totals(recipe_ids, sign, user_id=None):
+    """Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты рецептов.
+
+    С user_id - из списка покупок одного пользователя (рецепты добавлены
+    в его корзину или удалены из неё), без user_id - из списков всех
+    пользователей, у которых рецепты в корзине (изменение или удаление
+    рецепта). Одна команда INSERT ... ON CONFLICT DO UPDATE, при вычитании
+    ещё одна удаляет обнулившиеся строки.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    recipes = placeholders(recipe_ids)
+    sign = '' if sign > 0 else '-'
+    if user_id is None:
+        select = FAN_OUT_TOTALS.format(sign=sign, recipes=recipes)
+        params = recipe_ids
+        users = (f'SELECT user_id FROM recipes_shoppingcart '
+                 f'WHERE recipe_id IN ({recipes})')
+        users_params = recipe_ids
+    else:
+        select = RECIPE_TOTALS.format(sign=sign, recipes=recipes)
+        params = [user_id] + recipe_ids
+        users, users_params = '%s', [user_id]
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT.format(select=select), params)
+        if sign:
+            cursor.execute(DELETE_EMPTY.format(users=users), users_params)
+
+
+def mismatched_users():
+    """Пользователи, чей список покупок расходится с корзиной."""
+    sql = MISMATCHED_USERS.format(totals=CART_TOTALS.format(where='1 = 1'))
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return sorted(user for user, in cursor.fetchall())
+
+
+@transaction.atomic
+def rebuild_shopping_lists(user_ids=None):
+    """Пересобирает списки покупок пользователей (всех, если None)."""
+    items = ShoppingListItem.objects.all()
+    where, params = '1 = 1', []
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        items = items.filter(user__in=user_ids)
+        where = f'cart.user_id IN ({placeholders(user_ids)})'
+        params = user_ids
+    items.delete()
+    sql = (
+        'INSERT INTO recipes_shoppinglistitem '
+        '(user_id, ingredient_id, total_amount) '
+        + CART_TOTALS.format(where=where)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def cart_ingredients(user):
+    """Суммы ингредиентов рецептов из корзины user.
+
+    Читаются из ShoppingListItem по индексу (user, ingredient);
+    количества переводятся в базовые единицы и суммируются по
+    (название, базовая единица), поэтому "г" и "кг" одного ингредиента
+    дают одну строку.
+    """
+    unit = 'ingredient__measurement_unit'
+    return ShoppingListItem.objects.filter(user=user).values(
+        name=F('ingredient__name'), unit=base_unit(unit),
+    ).annotate(
+        total=Sum(base_amount('total_amount', unit)),
+    ).order_by('name', 'unit')
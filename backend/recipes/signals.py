@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from recipes.counters import COUNTERS, change_counter
+from recipes.models import Ingredient, Recipe, RecipeIngredient, ShoppingCart
+from recipes.relations import relations_changed
+from recipes.scores import SCORE_EVENTS, change_score
+from recipes.search import ingredient_index, update_search_index
+from recipes.shopping import change_cart_totals
+
+# Справочник загружен массово, минуя post_save (sender - модель).
+catalog_loaded = Signal()
+
+
+@receiver([post_save, post_delete, catalog_loaded], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def index_recipe(sender, instance, raw=False, **kwargs):
+    # После фиксации транзакции: ингредиенты рецепта записываются
+    # в той же транзакции уже после сохранения самого рецепта.
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: update_search_index([pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient_recipes(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    update_search_index(RecipeIngredient.objects.filter(
+        ingredient=instance,
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(relations_changed, sender=ShoppingCart)
+def update_shopping_list(sender, user, targets, added, **kwargs):
+    change_cart_totals(targets, 1 if added else -1, user_id=user.pk)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, raw=False,
+                         batched=False, **kwargs):
+    # Админка и create(); add_relations обрабатывает update_shopping_list.
+    if created and not raw and not batched:
+        change_cart_totals([instance.recipe_id], 1, user_id=instance.user_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    # Админка, delete() и каскадное удаление рецепта или пользователя:
+    # pre_delete всех объектов отправляется до удаления первого из них,
+    # поэтому ингредиенты рецепта ещё на месте. remove_relations
+    # pre_delete не отправляет.
+    change_cart_totals([instance.recipe_id], -1, user_id=instance.user_id)
+
+
+def update_counter(sender, instance, created=True, raw=False, signal=None,
+                   **kwargs):
+    if not created or raw:
+        return
+    delta = -1 if signal is post_delete else 1
+    for model, field, related, fk in COUNTERS:
+        if sender is related:
+            change_counter(
+                model, getattr(instance, f'{fk}_id'), field, delta,
+            )
+    if sender in SCORE_EVENTS:
+        change_score(instance, delta)
+
+
+for _, _, related, _ in COUNTERS:
+    post_save.connect(update_counter, sender=related)
+    post_delete.connect(update_counter, sender=related)
@@ -0,0 +1,392 @@
+import base64
+import binascii
+import json
+import mimetypes
+import os
+import tarfile
+import tempfile
+
+from hashlib import sha256
+from io import BytesIO
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import NotSupportedError, connection, transaction
+from django.db.models import Prefetch
+from PIL import Image
+
+from recipes.counters import change_counter
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.search import update_search_index
+
+User = get_user_model()
+
+# Формат обмена - NDJSON, по рецепту на строку:
+# {"name": ..., "text": ..., "cooking_time": 10, "tags": ["breakfast"],
+#  "ingredients": [{"name": ..., "measurement_unit": ..., "amount": 1}],
+#  "image": "data:image/png;base64,..."}
+# Тэги задаются slug или id, ингредиенты - id или названием с единицей.
+# В tar рецепты лежат в MANIFEST, а "image" - путь к файлу в архиве.
+MANIFEST = 'recipes.ndjson'
+IMAGES_DIR = 'images/'
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz')
+BATCH_SIZE = 500
+MAX_NAME_LENGTH = Recipe._meta.get_field('name').max_length
+MAX_SMALL_INT = 32767
+
+
+def is_tar(name):
+    return name.lower().endswith(TAR_EXTENSIONS)
+
+
+class RecipeSource:
+    """Строки NDJSON и изображения из файла NDJSON или tar."""
+
+    def __init__(self, file, name):
+        self.archive = None
+        self.lines = file
+        if is_tar(name):
+            try:
+                self.archive = tarfile.open(fileobj=file, mode='r:*')
+                self.lines = self.archive.extractfile(MANIFEST)
+            except tarfile.TarError:
+                raise ValueError(f'Не удалось прочитать архив: {name}.')
+            except KeyError:
+                raise ValueError(f'В архиве нет {MANIFEST}.')
+
+    def records(self):
+        """Пары (номер строки, строка) без пустых строк."""
+        for number, line in enumerate(self.lines, 1):
+            if line.strip():
+                yield number, line
+
+    def image(self, value):
+        """Байты изображения: data URI, Base64 или файл архива."""
+        if self.archive is not None and value.startswith(IMAGES_DIR):
+            try:
+                member = self.archive.extractfile(value)
+            except KeyError:
+                member = None
+            if member is None:
+                raise ValueError(f'В архиве нет файла {value}.')
+            return member.read()
+        if ';base64,' in value:
+            value = value.split(';base64,', 1)[1]
+        try:
+            return base64.b64decode(value, validate=True)
+        except binascii.Error:
+            raise ValueError('Ожидается data URI или Base64.')
+
+
+class Catalog:
+    """Тэги и ингредиенты, загруженные один раз на весь импорт."""
+
+    def __init__(self):
+        self.tags = {}
+        for pk, slug in Tag.objects.values_list('pk', 'slug'):
+            self.tags[pk] = self.tags[slug] = pk
+        self.ingredients = {}
+        for pk, name, unit in Ingredient.objects.values_list(
+            'pk', 'name', 'measurement_unit',
+        ):
+            self.ingredients[pk] = self.ingredients[name, unit] = pk
+
+    def ingredient(self, item):
+        if 'id' in item:
+            pk = item['id']
+            return self.ingredients.get(pk) if is_int(pk) else None
+        key = (item.get('name'), item.get('measurement_unit'))
+        if not all(isinstance(value, str) for value in key):
+            return None
+        return self.ingredients.get(key)
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def small_int(value):
+    return is_int(value) and 1 <= value <= MAX_SMALL_INT
+
+
+def image_extension(content):
+    """Расширение файла изображения или ValueError."""
+    try:
+        with Image.open(BytesIO(content)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:
+        raise ValueError('Файл не является изображением.')
+    return 'jpg' if image_format == 'JPEG' else image_format.lower()
+
+
+def clean_text(value, max_length=None):
+    if not isinstance(value, str) or not value.strip():
+        return None, 'Обязательное поле.'
+    if max_length is not None and len(value) > max_length:
+        return None, f'Не длиннее {max_length} символов.'
+    return value, None
+
+
+def clean_small_int(value):
+    if not small_int(value):
+        return None, f'Целое число от 1 до {MAX_SMALL_INT}.'
+    return value, None
+
+
+def clean_tags(tags, catalog):
+    """(pk тэгов без повторов, None) или (None, ошибка)."""
+    if not isinstance(tags, list) or not tags:
+        return None, 'Нужен непустой список тэгов.'
+    unknown = [tag for tag in tags
+               if not (is_int(tag) or isinstance(tag, str))
+               or catalog.tags.get(tag) is None]
+    if unknown:
+        return None, f'Неизвестные тэги: {unknown}.'
+    return list(dict.fromkeys(catalog.tags[tag] for tag in tags)), None
+
+
+def clean_ingredients(ingredients, catalog):
+    """({pk ингредиента: количество}, None) или (None, ошибка)."""
+    if not isinstance(ingredients, list) or not ingredients:
+        return None, 'Нужен непустой список ингредиентов.'
+    amounts = {}
+    for number, item in enumerate(ingredients):
+        pk = catalog.ingredient(item) if isinstance(item, dict) else None
+        if pk is None:
+            return None, f'Ингредиент {number}: не найден.'
+        if not small_int(item.get('amount')):
+            return None, (f'Ингредиент {number}: количество - целое число '
+                          f'от 1 до {MAX_SMALL_INT}.')
+        if pk in amounts:
+            return None, f'Ингредиент {number}: повторяется.'
+        amounts[pk] = item['amount']
+    return amounts, None
+
+
+def clean_record(line, catalog, source):
+    """Проверяет строку импорта: (данные рецепта, None) или (None, ошибки)."""
+    try:
+        record = json.loads(line)
+    except ValueError as error:
+        return None, {'line': f'Некорректный JSON: {error}'}
+    if not isinstance(record, dict):
+        return None, {'line': 'Ожидается объект JSON.'}
+    fields = {
+        'name': clean_text(record.get('name'), MAX_NAME_LENGTH),
+        'text': clean_text(record.get('text')),
+        'cooking_time': clean_small_int(record.get('cooking_time')),
+        'tags': clean_tags(record.get('tags'), catalog),
+        'ingredients': clean_ingredients(record.get('ingredients'), catalog),
+    }
+    data = {field: value for field, (value, _) in fields.items()}
+    errors = {field: error for field, (_, error) in fields.items() if error}
+    image = record.get('image')
+    if not isinstance(image, str) or not image:
+        errors['image'] = 'Обязательное поле.'
+    elif not errors:
+        # Изображение разбирается последним: это самая дорогая проверка.
+        try:
+            data['image'] = source.image(image)
+            data['extension'] = image_extension(data['image'])
+        except ValueError as error:
+            errors['image'] = str(error)
+    if errors:
+        return None, errors
+    return data, None
+
+
+def save_image(content, extension):
+    """Сохраняет оригинал изображения под именем по содержимому.
+
+    Одинаковые изображения и повторный импорт не плодят копий.
+    """
+    upload_to = Recipe._meta.get_field('image').upload_to
+    name = f'{upload_to}{sha256(content).hexdigest()}.{extension}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def create_recipes(recipes, author):
+    """Создаёт рецепты и возвращает их pk в порядке recipes.
+
+    Вызывается в транзакции. PostgreSQL возвращает pk из bulk_create.
+    SQLite не возвращает, но допускает одного пишущего: после INSERT
+    блокировка записи держится до конца транзакции, и другой импорт,
+    в том числе от того же автора, ждёт её. Поэтому последние рецепты
+    автора - только что вставленные, в порядке вставки. Другие базы
+    без RETURNING таких гарантий не дают и не поддерживаются.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return [recipe.pk for recipe in Recipe.objects.bulk_create(recipes)]
+    if connection.vendor != 'sqlite':
+        raise NotSupportedError(
+            'Импорт рецептов требует PostgreSQL или SQLite.'
+        )
+    Recipe.objects.bulk_create(recipes)
+    pks = list(Recipe.objects.filter(author=author).order_by(
+        '-pk',
+    ).values_list('pk', flat=True)[:len(recipes)])
+    pks.reverse()
+    for recipe, pk in zip(recipes, pks):
+        recipe.pk = pk
+    return pks
+
+
+def save_recipes(batch, author):
+    """Создаёт проверенные рецепты пачки, возвращает их pk.
+
+    bulk_create минует post_save, поэтому счётчик рецептов автора
+    и поисковый индекс обновляются здесь. Варианты изображений
+    создаёт команда process_images.
+    """
+    if not batch:
+        return []
+    images = [save_image(data['image'], data['extension']) for data in batch]
+    with transaction.atomic():
+        pks = create_recipes([
+            Recipe(
+                author=author, name=data['name'], text=data['text'],
+                cooking_time=data['cooking_time'], image=image,
+            )
+            for data, image in zip(batch, images)
+        ], author)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=pk, tag_id=tag)
+            for pk, data in zip(pks, batch) for tag in data['tags']
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe_id=pk, ingredient_id=ingredient,
+                             amount=amount)
+            for pk, data in zip(pks, batch)
+            for ingredient, amount in data['ingredients'].items()
+        )
+        change_counter(User, author.pk, 'recipes_count', len(pks))
+        update_search_index(pks)
+    return pks
+
+
+def import_recipes(source, author, batch_size=BATCH_SIZE):
+    """Импортирует рецепты из source от имени author.
+
+    Строки проверяются и сохраняются пачками по batch_size, каждая пачка -
+    в своей транзакции. Возвращает (число созданных рецептов, ошибки),
+    ошибки - список (номер строки, {поле: сообщение}).
+    """
+    catalog = Catalog()
+    records = source.records()
+    created, errors = 0, []
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        batch = []
+        for number, line in chunk:
+            data, line_errors = clean_record(line, catalog, source)
+            if line_errors:
+                errors.append((number, line_errors))
+            else:
+                batch.append(data)
+        created += len(save_recipes(batch, author))
+    return created, errors
+
+
+def iter_recipes(queryset, batch_size=BATCH_SIZE):
+    """Рецепты queryset пачками по pk с тэгами и ингредиентами."""
+    queryset = queryset.select_related('author').prefetch_related(
+        Prefetch('tags', Tag.objects.only('slug')),
+        Prefetch(
+            'recipe_ingredients',
+            RecipeIngredient.objects.select_related('ingredient'),
+        ),
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        yield from batch
+        last_pk = batch[-1].pk
+
+
+def export_record(recipe, image):
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'author': recipe.author.email,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipe_ingredients.all()
+        ],
+        'image': image,
+    }
+
+
+def read_image(recipe):
+    """Байты оригинала изображения или None, если файла нет."""
+    if not recipe.image or not default_storage.exists(recipe.image.name):
+        return None
+    with default_storage.open(recipe.image.name) as file:
+        return file.read()
+
+
+def export_recipes(queryset, file, name):
+    """Выгружает рецепты в формате импорта, возвращает (число, без фото).
+
+    В NDJSON изображения встраиваются как data URI, в tar (по расширению
+    name) - отдельными файлами каталога images/.
+    """
+    if not is_tar(name):
+        return write_recipes(queryset, file, embed_image)
+    mode = 'w:gz' if name.lower().endswith(('.gz', '.tgz')) else 'w'
+    added = set()
+    with tarfile.open(fileobj=file, mode=mode) as archive:
+
+        def add_image(recipe, content):
+            path = IMAGES_DIR + os.path.basename(recipe.image.name)
+            if path not in added:
+                add_member(archive, path, BytesIO(content), len(content))
+                added.add(path)
+            return path
+
+        with tempfile.TemporaryFile() as lines:
+            result = write_recipes(queryset, lines, add_image)
+            size = lines.tell()
+            lines.seek(0)
+            add_member(archive, MANIFEST, lines, size)
+    return result
+
+
+def embed_image(recipe, content):
+    mime = mimetypes.guess_type(recipe.image.name)[0] or 'image/jpeg'
+    return f'data:{mime};base64,{base64.b64encode(content).decode()}'
+
+
+def add_member(archive, path, file, size):
+    member = tarfile.TarInfo(path)
+    member.size = size
+    archive.addfile(member, file)
+
+
+def write_recipes(queryset, file, image_value):
+    """Пишет рецепты строками NDJSON; image_value(рецепт, байты) -> "image"."""
+    exported, missing = 0, []
+    for recipe in iter_recipes(queryset):
+        content = read_image(recipe)
+        if content is None:
+            missing.append(recipe.pk)
+        image = None if content is None else image_value(recipe, content)
+        file.write(json.dumps(
+            export_record(recipe, image), ensure_ascii=False,
+        ).encode() + b'\n')
+        exported += 1
+    return exported, missing
@@ -0,0 +1,52 @@
+from django.db.models import Case, CharField, F, IntegerField, Value, When
+
+# Единица измерения: (базовая единица, сколько в ней базовых единиц).
+# Единицы не из таблицы ("шт.", "ст. л.") суммируются как есть.
+UNITS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+}
+# Базовая единица: (крупная единица, её размер) для вывода сумм.
+LARGE_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+
+
+def base_unit(field='measurement_unit'):
+    """Базовая единица для единицы измерения из поля field."""
+    return Case(
+        *[When(**{field: unit}, then=Value(base))
+          for unit, (base, _) in UNITS.items()],
+        default=F(field), output_field=CharField(),
+    )
+
+
+def base_amount(amount, field='measurement_unit'):
+    """Количество из поля amount в базовых единицах поля field."""
+    return Case(
+        *[When(**{field: unit}, then=F(amount) * size)
+          for unit, (_, size) in UNITS.items() if size != 1],
+        default=F(amount), output_field=IntegerField(),
+    )
+
+
+def humanize(amount, unit):
+    """Сумма в крупной единице, если её набирается хотя бы одна."""
+    large, size = LARGE_UNITS.get(unit, (unit, None))
+    if size is None or amount < size:
+        return amount, unit
+    amount /= size
+    return int(amount) if amount.is_integer() else round(amount, 3), large
+
+
+def humanize_rows(rows):
+    """Строки cart_ingredients для вывода: name, measurement_unit, amount.
+
+    Суммы переводятся в крупные единицы, где это возможно.
+    """
+    for row in rows:
+        amount, unit = humanize(row['total'], row['unit'])
+        yield {'name': row['name'], 'measurement_unit': unit, 'amount': amount}
@@ -19,9 +19,10 @@ class CustomUserAdmin(UserAdmin):
             'is_active', 'is_staff', 'is_superuser', 'user_permissions',
         )}),
         ('Информация', {'fields': (
-            'date_joined', 'last_login'
+            'date_joined', 'last_login', 'recipes_count', 'followers_count',
         )}),
     )
+    readonly_fields = ('recipes_count', 'followers_count', )
 
     list_display = (
         'pk', 'username', 'email', 'first_name', 'last_name', 'is_staff',
@@ -11,6 +11,8 @@ class CustomUser(AbstractUser):
         'Электронная почта', max_length=254, unique=True, blank=False,
         null=False
     )
+    recipes_count = models.PositiveIntegerField('Рецептов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
 
 
 class Follow(models.Model):